@@ -53,6 +53,7 @@ from flask_cors import CORS
 import cv2
 import numpy as np
 import base64
+import binascii
 from io import BytesIO
 from PIL import Image
 import traceback
@@ -61,6 +62,11 @@ import sys
 import time
 import threading
 import gc
+import tempfile
+import hashlib
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 _boot_mark("flask+cv2+numpy+PIL")
 
@@ -77,6 +83,16 @@ if cli:
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 logging.getLogger('mediapipe').setLevel(logging.CRITICAL)
 
+# ── OpenCV threading ────────────────────────────────────────────────────────
+# waitress already runs one request per thread and /analyze fans encodes out
+# to a worker pool. Letting OpenCV spawn its own pool inside every resize /
+# cvtColor / imencode on top of that oversubscribes the cores, and the lock
+# contention makes concurrent requests slower than serial ones. Keep OpenCV
+# single-threaded by default; OPENCV_NUM_THREADS=2 is the escape hatch if
+# single large-image latency regresses.
+cv2.setUseOptimized(True)
+cv2.setNumThreads(int(os.environ.get('OPENCV_NUM_THREADS', '1')))
+
 app = Flask(__name__)
 CORS(app)
 # Cap request body at 16 MB. Image endpoints decode base64 then expand into
@@ -86,8 +102,36 @@ CORS(app)
 # layer before any decoding happens, removing the DoS vector.
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 # Per-image pixel cap applied AFTER cv2.imdecode but BEFORE rembg / heavy
-# pipelines. Anything larger is downscaled proportionally.
+# pipelines. Anything larger is downscaled proportionally. Applied to /analyze
+# (process_photo), the endpoint that takes raw phone photos.
 MAX_IMAGE_DIM = 2048
+# zlib level for every PNG the analyzer returns. PNG is lossless at any level;
+# 9 costs several times the CPU of 1 on these mostly-flat cutouts and masks
+# for a few percent of size, and the Node side re-stores them anyway.
+PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_LEVEL', '1'))
+
+# ── JSON via orjson (optional) ──────────────────────────────────────────────
+# /analyze and the crop endpoints answer with several hundred KB of base64
+# data URLs, and the requests carry multi-MB ones. The stdlib json behind
+# jsonify() / request.get_json() escapes and scans those strings in Python;
+# orjson does it in C. Same output (sorted keys, str keys), no call-site
+# changes. Without orjson installed Flask's default provider is used.
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+
+    class _OrjsonProvider(JSONProvider):
+        _OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=self._OPTIONS).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = _OrjsonProvider(app)
+except ImportError:
+    pass
 
 # ── Self-recycle ────────────────────────────────────────────────────────────
 # Heavy inference leaves ~1GB of memory that CANNOT be reclaimed in-process.
@@ -151,6 +195,110 @@ except ImportError:
 
 _boot_mark("mediapipe")
 
+# ── Cached MediaPipe graphs ─────────────────────────────────────────────────
+# `with mp_face_detection.FaceDetection(...)` builds a fresh calculator graph
+# (TFLite interpreter + XNNPACK delegate) on entry and tears it down on exit,
+# so every detection paid graph construction on top of inference — and the
+# legacy multi-face path paid it twice per photo (model 0 and model 1). Build
+# each configuration once on first use and keep it. A graph is NOT safe to
+# drive from two threads at once and waitress serves requests concurrently, so
+# each one carries its own lock around process(); the hold is a few ms.
+# The Tasks API FaceDetector (kind 'tasks_face', Python 3.14+ fallback) is
+# cached the same way: create_from_options() loads the .tflite every time.
+_mp_graphs = {}
+_mp_graphs_lock = threading.Lock()
+
+
+def _get_mp_graph(kind, **params):
+    """Return (graph, lock) for a MediaPipe solution or Tasks detector, built once per config."""
+    key = (kind,) + tuple(sorted(params.items()))
+    entry = _mp_graphs.get(key)
+    if entry is not None:
+        return entry
+    with _mp_graphs_lock:
+        entry = _mp_graphs.get(key)
+        if entry is None:  # re-check under the lock
+            if kind == 'face':
+                graph = mp_face_detection.FaceDetection(**params)
+            elif kind == 'tasks_face':
+                model_path = os.path.join(os.path.dirname(__file__), 'blaze_face_short_range.tflite')
+                options = mp_vision.FaceDetectorOptions(
+                    base_options=mp_python.BaseOptions(model_asset_path=model_path), **params)
+                graph = mp_vision.FaceDetector.create_from_options(options)
+            else:
+                graph = mp_selfie_segmentation.SelfieSegmentation(**params)
+            entry = (graph, threading.Lock())
+            _mp_graphs[key] = entry
+    return entry
+
+
+def _close_mp_graphs():
+    """Close every cached MediaPipe graph. Returns how many were closed.
+
+    Used by /release-memory?unload=true so "drop every lazily-loaded model"
+    includes these too. Each graph's own lock is taken first, so a graph in
+    the middle of process() is never closed under it; the next detection
+    simply rebuilds. No atexit hook: the recycle path leaves via os._exit(),
+    which skips atexit, and process exit frees the graphs either way.
+    """
+    with _mp_graphs_lock:
+        entries = list(_mp_graphs.values())
+        _mp_graphs.clear()
+    for graph, lock in entries:
+        with lock:
+            try:
+                graph.close()
+            except Exception as e:
+                print(f"[WARN] MediaPipe graph close failed: {e}")
+    return len(entries)
+
+
+def _mp_process(kind, rgb_image, **params):
+    """Run one frame through the cached graph for (kind, params)."""
+    key = (kind,) + tuple(sorted(params.items()))
+    while True:
+        entry = _get_mp_graph(kind, **params)
+        graph, lock = entry
+        with lock:
+            # _close_mp_graphs() may have closed this graph while we waited
+            # for its lock; if so, loop and pick up a freshly built one.
+            if _mp_graphs.get(key) is entry:
+                if kind == 'tasks_face':
+                    return graph.detect(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image))
+                return graph.process(rgb_image)
+
+
+# MediaPipe's face and selfie models run at 128-256 px internally, so handing
+# them a 12 MP phone photo only pays for converting and resampling pixels the
+# network never sees. Inputs are capped to this long side first; detections
+# come back in relative (0-1) coordinates, so they map onto the full-resolution
+# image unchanged.
+MEDIAPIPE_MAX_DIM = 1280
+
+# /analyze runs face detection on a copy capped at this size. MTCNN's cost
+# scales with the pixel count of its image pyramid, and the boxes come back as
+# percentages, so thumbnails and crops are still cut from the full-resolution
+# frame. At 640 px MTCNN's 20 px minimum face is ~3% of the long side, which is
+# still well under a face in a group photo. Raise it if tiny faces go missing.
+FACE_DETECT_MAX_DIM = int(os.environ.get('FACE_DETECT_MAX_DIM', '640'))
+
+# /split-grid probes each quadrant of a generated 2x2 avatar with the
+# full-range model, whose network input is 192x192 (letterboxed). Anything
+# past ~256 px on the long side is resampled away inside the graph, so the
+# three quadrant probes run on 256 px copies instead of 640. The box is a
+# percentage and maps back onto the full-size quadrant unchanged.
+SPLIT_GRID_PROBE_DIM = 256
+
+
+def _shrink_for_mediapipe(image, max_dim=MEDIAPIPE_MAX_DIM):
+    """Downscale (INTER_AREA) so the long side is <= max_dim; no-op when already small."""
+    h, w = image.shape[:2]
+    scale = max_dim / max(h, w)
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
 # Try to initialize MTCNN (best accuracy)
 # Try mtcnn-opencv first (lightweight, no TensorFlow), then fall back to mtcnn (TensorFlow)
 MTCNN_AVAILABLE = False
@@ -230,9 +378,11 @@ def get_rembg_session():
 
 _boot_mark("rembg (lazy — not loaded)")
 
-# Create temp directory for processing
+# Debug output directory. Nothing in the request path touches disk any more —
+# uploads are decoded in memory — so the directory is only created when
+# PHOTO_DEBUG_SAVE=true asks for detection overlays to be written.
 TEMP_DIR = os.path.join(os.path.dirname(__file__), 'temp_photos')
-os.makedirs(TEMP_DIR, exist_ok=True)
+PHOTO_DEBUG_SAVE = os.environ.get('PHOTO_DEBUG_SAVE', 'false').lower() == 'true'
 
 # Load the OpenCV frontal-face Haar cascade ONCE at module load. Per-request
 # CascadeClassifier(...) parses + loads the XML every call (~10–30 ms wasted).
@@ -248,6 +398,67 @@ except Exception as _e:
     print(f"[WARN] Frontal face cascade init error: {_e}")
     _FRONTAL_FACE_CASCADE = None
 
+# ── YuNet (optional) ────────────────────────────────────────────────────────
+# OpenCV's DNN face detector. Where its ONNX file is present the OpenCV
+# fallbacks (detect_face_opencv / detect_all_faces_opencv) use it instead of
+# the Haar cascade: it is faster on a single SIMD pass, returns a real score,
+# and doesn't need the aspect-ratio filter Haar's false positives forced on
+# us. The Dockerfile bakes the model in next to this file when its pin
+# (YUNET_ZOO_COMMIT / YUNET_SHA256 build args) is set; without it Haar stays
+# the fallback.
+# Built lazily on first use; a failed build is remembered (_YUNET_FAILED) so
+# later calls go straight to Haar instead of retrying and warning every time.
+# setInputSize() mutates the detector, so size + detect run under one lock;
+# the hold is a few ms.
+YUNET_MODEL = os.environ.get('YUNET_MODEL') or os.path.join(
+    os.path.dirname(__file__), 'face_detection_yunet_2023mar.onnx')
+_YUNET_FAILED = object()
+_yunet = None
+_yunet_lock = threading.Lock()
+if not os.path.exists(YUNET_MODEL):
+    print(f"[INFO] YuNet model not found ({YUNET_MODEL}) - OpenCV face fallback uses Haar")
+
+
+def _detect_faces_yunet(image, score_threshold=0.6):
+    """
+    Detect faces in a BGR image with YuNet.
+    Returns a list of (x, y, w, h, score) in pixels, or None if YuNet is
+    unavailable (caller falls back to Haar).
+    """
+    global _yunet
+    if _yunet is _YUNET_FAILED or not os.path.exists(YUNET_MODEL):
+        return None
+    img_h, img_w = image.shape[:2]
+    with _yunet_lock:
+        if _yunet is None:
+            try:
+                _yunet = cv2.FaceDetectorYN.create(YUNET_MODEL, '', (img_w, img_h), score_threshold)
+                print("[OK] YuNet face detector loaded")
+            except Exception as e:
+                print(f"[WARN] YuNet init failed, using Haar: {e}")
+                _yunet = _YUNET_FAILED
+        if _yunet is _YUNET_FAILED:
+            return None
+        _yunet.setScoreThreshold(score_threshold)
+        _yunet.setInputSize((img_w, img_h))
+        _, detections = _yunet.detect(image)
+    if detections is None:
+        return []
+    return [_clip_box_px(float(d[0]), float(d[1]), float(d[2]), float(d[3]), img_w, img_h)
+            + (float(d[14]),) for d in detections]
+
+
+def _clip_box_px(x, y, w, h, img_w, img_h):
+    """
+    Clip a pixel box to the image. YuNet boxes can start left of / above the
+    frame for faces cut off at the edge; w/h shrink by what x/y give up so the
+    box keeps its far edge instead of sliding inward.
+    """
+    x2, y2 = min(float(img_w), x + w), min(float(img_h), y + h)
+    x, y = max(0.0, x), max(0.0, y)
+    return x, y, max(0.0, x2 - x), max(0.0, y2 - y)
+
+
 # Load anime face cascade (for illustrated/cartoon faces)
 ANIME_CASCADE_AVAILABLE = False
 anime_face_cascade = None
@@ -402,19 +613,17 @@ def detect_all_faces_anime(image, min_size=30, scale_factor=1.1, min_neighbors=2
         return []
 
 
-def detect_all_faces_mtcnn(image, min_confidence=0.9):
+def detect_all_faces_mtcnn(rgb_image, min_confidence=0.9):
     """
     Detect ALL faces using MTCNN (accurate and lightweight).
+    rgb_image: the photo in RGB, which is what MTCNN expects.
     Returns list of faces sorted by confidence (highest first).
     """
     if not MTCNN_AVAILABLE or mtcnn_detector is None:
         return []
 
     try:
-        img_h, img_w = image.shape[:2]
-
-        # MTCNN expects RGB, OpenCV uses BGR
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        img_h, img_w = rgb_image.shape[:2]
 
         # Detect faces
         faces_data = mtcnn_detector.detect_faces(rgb_image)
@@ -454,10 +663,24 @@ def detect_all_faces_mtcnn(image, min_confidence=0.9):
 
 def detect_face_opencv(image):
     """
-    Fallback face detection using OpenCV's Haar cascade.
-    Used when MediaPipe is not available (e.g., Python 3.14+).
+    Fallback face detection using OpenCV: YuNet when its model is present,
+    the Haar cascade when YuNet is unavailable or finds nothing. Used when MediaPipe is not available (e.g., Python 3.14+).
     Returns bounding box as percentage of image dimensions (0-100)
     """
+    img_h, img_w = image.shape[:2]
+
+    # YuNet first; if it is unavailable or finds nothing, Haar gets a try.
+    yunet_faces = _detect_faces_yunet(image)
+    if yunet_faces:
+        x, y, w, h, score = max(yunet_faces, key=lambda f: f[2] * f[3])
+        return {
+            'x': (x / img_w) * 100,
+            'y': (y / img_h) * 100,
+            'width': (w / img_w) * 100,
+            'height': (h / img_h) * 100,
+            'confidence': score
+        }
+
     # Module-level cascade (loaded once at startup) — see _FRONTAL_FACE_CASCADE.
     face_cascade = _FRONTAL_FACE_CASCADE
     if face_cascade is None:
@@ -478,7 +701,6 @@ def detect_face_opencv(image):
         # Get the largest face (by area)
         largest = max(faces, key=lambda f: f[2] * f[3])
         x, y, w, h = largest
-        img_h, img_w = image.shape[:2]
 
         return {
             'x': (x / img_w) * 100,
@@ -491,54 +713,75 @@ def detect_face_opencv(image):
     return None
 
 
-def detect_face_mediapipe(image):
+def detect_face_mediapipe(image, max_dim=FACE_DETECT_MAX_DIM):
     """
     Detect face using MediaPipe Face Detection.
     Falls back to OpenCV Haar cascade if MediaPipe is unavailable.
     Returns bounding box as percentage of image dimensions (0-100)
+
+    max_dim caps the long side handed to MediaPipe (see FACE_DETECT_MAX_DIM).
     """
     if not MEDIAPIPE_AVAILABLE:
         # Fallback to OpenCV when MediaPipe is not available (Python 3.14+)
         return detect_face_opencv(image)
 
-    with mp_face_detection.FaceDetection(
+    # Convert BGR to RGB (after capping the size; the box is relative)
+    rgb_image = cv2.cvtColor(_shrink_for_mediapipe(image, max_dim), cv2.COLOR_BGR2RGB)
+    results = _mp_process(
+        'face', rgb_image,
         model_selection=1,  # 0 for close faces, 1 for far faces
         min_detection_confidence=0.5
-    ) as face_detection:
-        # Convert BGR to RGB
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = face_detection.process(rgb_image)
+    )
 
-        if results.detections:
-            # Get the first (most confident) detection
-            detection = results.detections[0]
-            bbox = detection.location_data.relative_bounding_box
+    if results.detections:
+        # Get the first (most confident) detection
+        detection = results.detections[0]
+        bbox = detection.location_data.relative_bounding_box
 
-            # Convert to percentage (0-100)
-            return {
-                'x': bbox.xmin * 100,
-                'y': bbox.ymin * 100,
-                'width': bbox.width * 100,
-                'height': bbox.height * 100,
-                'confidence': detection.score[0]
-            }
+        # Convert to percentage (0-100)
+        return {
+            'x': bbox.xmin * 100,
+            'y': bbox.ymin * 100,
+            'width': bbox.width * 100,
+            'height': bbox.height * 100,
+            'confidence': detection.score[0]
+        }
 
     return None
 
 
 def detect_all_faces_opencv(image):
     """
-    Fallback to detect all faces using OpenCV's Haar cascade.
+    Fallback to detect all faces using OpenCV: YuNet when its model is
+    present, the Haar cascade (with stricter settings and an aspect filter to
+    reduce false positives) when YuNet is unavailable or finds nothing.
     Returns list of faces sorted by size (largest first).
-    More strict settings to reduce false positives.
     """
+    img_h, img_w = image.shape[:2]
+
+    # YuNet first; if it is unavailable or finds nothing, Haar gets a try.
+    yunet_faces = _detect_faces_yunet(image)
+    if yunet_faces:
+        faces = []
+        for x, y, w, h, score in yunet_faces:
+            faces.append({
+                'x': (x / img_w) * 100,
+                'y': (y / img_h) * 100,
+                'width': (w / img_w) * 100,
+                'height': (h / img_h) * 100,
+                'confidence': score
+            })
+        faces.sort(key=lambda f: f['width'] * f['height'], reverse=True)
+        for i, face in enumerate(faces):
+            face['id'] = i
+        return faces
+
     # Module-level cascade (loaded once at startup) — see _FRONTAL_FACE_CASCADE.
     face_cascade = _FRONTAL_FACE_CASCADE
     if face_cascade is None:
         return []
 
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    img_h, img_w = image.shape[:2]
 
     # Minimum face size: at least 4% of smaller image dimension (not too strict)
     min_face_size = int(min(img_w, img_h) * 0.04)
@@ -578,50 +821,31 @@ def detect_all_faces_opencv(image):
     return faces
 
 
-def detect_all_faces_mediapipe_tasks(image, min_confidence=0.15):
+def detect_all_faces_mediapipe_tasks(rgb_image, min_confidence=0.15):
     """
     Detect ALL faces using MediaPipe Tasks API (Python 3.14+).
+    rgb_image: the photo in RGB, which is what MediaPipe expects.
     Returns list of faces sorted by confidence (highest first).
     """
-    from mediapipe.tasks import python as mp_python
-    from mediapipe.tasks.python import vision as mp_vision
-
-    model_path = os.path.join(os.path.dirname(__file__), 'blaze_face_short_range.tflite')
+    # Detect faces with the cached detector for this confidence threshold
+    detection_result = _mp_process('tasks_face', rgb_image, min_detection_confidence=min_confidence)
 
-    # Create face detector
-    base_options = mp_python.BaseOptions(model_asset_path=model_path)
-    options = mp_vision.FaceDetectorOptions(
-        base_options=base_options,
-        min_detection_confidence=min_confidence
-    )
+    img_h, img_w = rgb_image.shape[:2]
 
     faces = []
-    with mp_vision.FaceDetector.create_from_options(options) as detector:
-        # Convert BGR to RGB
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        # Create MediaPipe Image
-        import mediapipe as mp
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
-
-        # Detect faces
-        detection_result = detector.detect(mp_image)
+    for idx, detection in enumerate(detection_result.detections):
+        bbox = detection.bounding_box
+        confidence = detection.categories[0].score if detection.categories else 0.5
 
-        img_h, img_w = image.shape[:2]
-
-        for idx, detection in enumerate(detection_result.detections):
-            bbox = detection.bounding_box
-            confidence = detection.categories[0].score if detection.categories else 0.5
-
-            face = {
-                'id': idx,
-                'x': (bbox.origin_x / img_w) * 100,
-                'y': (bbox.origin_y / img_h) * 100,
-                'width': (bbox.width / img_w) * 100,
-                'height': (bbox.height / img_h) * 100,
-                'confidence': confidence
-            }
-            faces.append(face)
+        face = {
+            'id': idx,
+            'x': (bbox.origin_x / img_w) * 100,
+            'y': (bbox.origin_y / img_h) * 100,
+            'width': (bbox.width / img_w) * 100,
+            'height': (bbox.height / img_h) * 100,
+            'confidence': confidence
+        }
+        faces.append(face)
 
     # Sort by confidence, then by x position for stability between API calls
     faces.sort(key=lambda f: (-f['confidence'], f['x']))
@@ -631,21 +855,24 @@ def detect_all_faces_mediapipe_tasks(image, min_confidence=0.15):
     return faces
 
 
-def detect_all_faces_mediapipe(image, min_confidence=0.15):
+def detect_all_faces_mediapipe(rgb_image, min_confidence=0.15):
     """
     Detect ALL faces using MTCNN (most accurate).
     Falls back to MediaPipe only if MTCNN not available.
     No OpenCV fallback to avoid false positives.
 
+    rgb_image: the photo in RGB. Every detector here consumes RGB, so this
+    takes only the RGB frame; there is no BGR argument to mix it up with.
+
     Returns: list of {id, x, y, width, height, confidence}
     """
     # Use MTCNN (most accurate) - no fallbacks to avoid false positives
     if MTCNN_AVAILABLE:
-        return detect_all_faces_mtcnn(image, min_confidence=0.9)
+        return detect_all_faces_mtcnn(rgb_image, min_confidence=0.9)
 
     # Fall back to MediaPipe Tasks API if MTCNN not available
     if MEDIAPIPE_TASKS_AVAILABLE:
-        faces = detect_all_faces_mediapipe_tasks(image, min_confidence=min_confidence)
+        faces = detect_all_faces_mediapipe_tasks(rgb_image, min_confidence=min_confidence)
         # Sort by confidence, then by x position for stability
         faces.sort(key=lambda f: (-f['confidence'], f['x']))
         for i, face in enumerate(faces):
@@ -658,52 +885,59 @@ def detect_all_faces_mediapipe(image, min_confidence=0.15):
         return []
 
     faces = []
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    centers = []  # (cx, cy) of each entry in faces, kept in step with updates
 
     # Try BOTH model types and combine results for better detection
     # model_selection=0: close faces (within 2m), model_selection=1: far faces (up to 5m)
     for model_type in [0, 1]:
-        with mp_face_detection.FaceDetection(
+        if model_type == 1:
+            # The far-range pass is a second full inference. Skip it when the
+            # close-range pass already settled the photo: a confident face
+            # filling a quarter of the frame (a portrait, where any other face
+            # is close-range too), or three confident faces (a group shot).
+            confident = [f for f in faces if f['confidence'] > 0.6]
+            if len(confident) >= 3 or any(f['width'] >= 25 for f in confident):
+                break
+        results = _mp_process(
+            'face', rgb_image,
             model_selection=model_type,
             min_detection_confidence=0.1  # Very low - we filter ourselves at 0.15
-        ) as face_detection:
-            results = face_detection.process(rgb_image)
-
-            if results.detections:
-                for idx, detection in enumerate(results.detections):
-                    confidence = detection.score[0]
-
-                    # Filter by our threshold
-                    if confidence < min_confidence:
-                        continue
-
-                    bbox = detection.location_data.relative_bounding_box
-                    face = {
-                        'id': len(faces),
-                        'x': bbox.xmin * 100,
-                        'y': bbox.ymin * 100,
-                        'width': bbox.width * 100,
-                        'height': bbox.height * 100,
-                        'confidence': confidence
-                    }
-
-                    # Check if this face overlaps with existing faces (avoid duplicates)
-                    is_duplicate = False
-                    for existing in faces:
-                        # Check if centers are close (within 10% of image)
-                        center_x = face['x'] + face['width'] / 2
-                        center_y = face['y'] + face['height'] / 2
-                        existing_cx = existing['x'] + existing['width'] / 2
-                        existing_cy = existing['y'] + existing['height'] / 2
-                        if abs(center_x - existing_cx) < 10 and abs(center_y - existing_cy) < 10:
-                            # Keep the higher confidence one
-                            if face['confidence'] > existing['confidence']:
-                                existing.update(face)
-                            is_duplicate = True
-                            break
-
-                    if not is_duplicate:
-                        faces.append(face)
+        )
+
+        if results.detections:
+            for idx, detection in enumerate(results.detections):
+                confidence = detection.score[0]
+
+                # Filter by our threshold
+                if confidence < min_confidence:
+                    continue
+
+                bbox = detection.location_data.relative_bounding_box
+                face = {
+                    'id': len(faces),
+                    'x': bbox.xmin * 100,
+                    'y': bbox.ymin * 100,
+                    'width': bbox.width * 100,
+                    'height': bbox.height * 100,
+                    'confidence': confidence
+                }
+
+                # Check if this face overlaps with existing faces (avoid duplicates):
+                # centers within 10% of the image. The new face's center is
+                # computed once and the kept ones are cached, instead of
+                # recomputing both for every pair.
+                center_x = face['x'] + face['width'] / 2
+                center_y = face['y'] + face['height'] / 2
+                for i, (existing_cx, existing_cy) in enumerate(centers):
+                    if abs(center_x - existing_cx) < 10 and abs(center_y - existing_cy) < 10:
+                        # Keep the higher confidence one
+                        if face['confidence'] > faces[i]['confidence']:
+                            faces[i].update(face)
+                            centers[i] = (center_x, center_y)
+                        break
+                else:
+                    faces.append(face)
+                    centers.append((center_x, center_y))
 
     # Sort by confidence, then by x position for stability between API calls
     faces.sort(key=lambda f: (-f['confidence'], f['x']))
@@ -713,7 +947,66 @@ def detect_all_faces_mediapipe(image, min_confidence=0.15):
     return faces
 
 
-def create_face_thumbnail(image, face_box, size=200):
+# Warm peach canvas behind face thumbnails (BGR)
+_PEACH_BGR = (230, 240, 255)
+
+
+def _pad_to_square(img, value=_PEACH_BGR):
+    """
+    Center `img` on a square canvas filled with `value`.
+
+    One cv2.copyMakeBorder pass instead of np.full(max_dim²) followed by a
+    slice assignment: the canvas is written once, border and image together.
+    """
+    h, w = img.shape[:2]
+    max_dim = max(h, w)
+    top = (max_dim - h) // 2
+    left = (max_dim - w) // 2
+    return cv2.copyMakeBorder(img, top, max_dim - h - top, left, max_dim - w - left,
+                              cv2.BORDER_CONSTANT, value=value)
+
+
+def _fit_square(img, size, value=_PEACH_BGR):
+    """
+    Scale `img` so its longer side is `size`, then center it on a size x size
+    canvas filled with `value`.
+
+    Resizing before padding means only the crop's own pixels are resampled;
+    padding to max(h, w)² first made cv2.resize also interpolate the flat
+    margins, up to half the canvas on a narrow crop.
+
+    INTER_AREA when shrinking: an 8x8-tap Lanczos kernel buys nothing visible
+    on a >2x box downscale and costs several times as much. Crops smaller than
+    the target are enlarged with INTER_CUBIC.
+    """
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+    if (new_w, new_h) != (w, h):
+        interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        img = cv2.resize(img, (new_w, new_h), interpolation=interp)
+    return _pad_to_square(img, value)
+
+
+def _flatten_onto_peach(bgra):
+    """
+    Composite a BGRA crop onto the peach background. Returns BGR, same size.
+
+    Blending on the crop's own footprint and padding afterwards (_fit_square)
+    avoids filling and blending a max(h, w)² BGRA canvas whose margins are
+    plain peach anyway.
+
+    cv2.blendLinear does the multiply-add in one pass with per-pixel float32
+    weights (alpha and 255 - alpha) instead of numpy building three float64
+    temporaries of the crop: ~2.5x faster, rounded rather than truncated
+    (at most 1 level apart).
+    """
+    bgr = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+    alpha = cv2.extractChannel(bgra, 3).astype(np.float32)
+    return cv2.blendLinear(bgr, np.full_like(bgr, _PEACH_BGR), alpha, 255.0 - alpha)
+
+
+def create_face_thumbnail(image, face_box, size=200, quality=90):
     """
     Create a square thumbnail for a detected face.
     Uses 30% padding around face, centers in square.
@@ -722,51 +1015,31 @@ def create_face_thumbnail(image, face_box, size=200):
         image: BGR or BGRA image (numpy array)
         face_box: dict with x, y, width, height (percentages 0-100)
         size: output thumbnail size (default 200x200)
+        quality: JPEG quality of the encoded thumbnail
 
     Returns: base64-encoded JPEG string
     """
     # Asymmetric padding: more top for hair, less bottom to avoid shoulders
-    # top=50% for full hair, bottom=15% below chin, sides=25%
-    face_box_padded = add_asymmetric_padding_to_box(face_box, top=0.50, bottom=0.15, left=0.25, right=0.25)
-    face_img = crop_to_box(image, face_box_padded)
+    face_img = crop_to_box(image, add_asymmetric_padding_to_box(face_box, **_THUMB_PADDING))
 
     if face_img.size == 0:
         return None
 
-    # Make it square with warm peach background
-    h, w = face_img.shape[:2]
-    max_dim = max(h, w)
-
-    # Create square canvas
     if len(face_img.shape) == 3 and face_img.shape[2] == 4:
         # BGRA image - composite with peach background
-        square = np.full((max_dim, max_dim, 4), [230, 240, 255, 255], dtype=np.uint8)
-        y_off = (max_dim - h) // 2
-        x_off = (max_dim - w) // 2
-
-        face_region = square[y_off:y_off+h, x_off:x_off+w]
-        alpha = face_img[:, :, 3:4] / 255.0
-        face_region[:, :, :3] = (face_img[:, :, :3] * alpha + face_region[:, :, :3] * (1 - alpha)).astype(np.uint8)
-        face_region[:, :, 3] = 255
-
-        # Convert to BGR for encoding
-        square_bgr = cv2.cvtColor(square, cv2.COLOR_BGRA2BGR)
+        face_bgr = _flatten_onto_peach(face_img)
     else:
-        # BGR image - just place on background
-        square_bgr = np.full((max_dim, max_dim, 3), [230, 240, 255], dtype=np.uint8)
-        y_off = (max_dim - h) // 2
-        x_off = (max_dim - w) // 2
-        square_bgr[y_off:y_off+h, x_off:x_off+w] = face_img[:, :, :3] if len(face_img.shape) == 3 else cv2.cvtColor(face_img, cv2.COLOR_GRAY2BGR)
+        face_bgr = face_img[:, :, :3] if len(face_img.shape) == 3 else cv2.cvtColor(face_img, cv2.COLOR_GRAY2BGR)
 
-    # Resize to target size
-    thumbnail = cv2.resize(square_bgr, (size, size), interpolation=cv2.INTER_LANCZOS4)
+    # Resize to target size and make it square with warm peach background
+    thumbnail = _fit_square(face_bgr, size)
 
     # Encode as JPEG
-    _, buffer = cv2.imencode('.jpg', thumbnail, [cv2.IMWRITE_JPEG_QUALITY, 90])
-    return f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+    _, buffer = cv2.imencode('.jpg', thumbnail, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return f"data:image/jpeg;base64,{_b64encode(buffer)}"
 
 
-def remove_faces_except(image, keep_face_id, all_faces):
+def remove_faces_except(image, keep_face_id, all_faces, in_place=False):
     """
     Remove non-selected people by blanking maximum area while preserving the kept person.
 
@@ -782,18 +1055,21 @@ def remove_faces_except(image, keep_face_id, all_faces):
         image: BGRA numpy array (must have alpha channel)
         keep_face_id: ID of face to keep (0-indexed)
         all_faces: list of face dicts with x, y, width, height (percentages 0-100)
+        in_place: blank directly in `image` (BGRA only) instead of a copy; for
+            callers that own the array, e.g. the cutout from remove_background
 
     Returns: image with non-selected people blanked out
     """
     if not all_faces or len(all_faces) <= 1:
         return image
 
-    result = image.copy()
     h, w = image.shape[:2]
 
-    # Ensure image has alpha channel
-    if len(result.shape) == 2 or result.shape[2] == 3:
-        result = cv2.cvtColor(result, cv2.COLOR_BGR2BGRA)
+    # Ensure image has alpha channel (the conversion is a fresh copy already)
+    if len(image.shape) == 2 or image.shape[2] == 3:
+        result = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    else:
+        result = image if in_place else image.copy()
 
     # Get the kept face
     kept_face = next((f for f in all_faces if f['id'] == keep_face_id), None)
@@ -842,13 +1118,6 @@ def remove_faces_except(image, keep_face_id, all_faces):
                 remove_y1 = int(max(0, unwanted_top) / 100 * h)
                 remove_y2 = h
                 print(f"   Side-by-side RIGHT: remove x={midpoint:.1f}%-100%, y={unwanted_top:.1f}%-100%")
-
-            # Blank out the region
-            if remove_x2 > remove_x1 and remove_y2 > remove_y1:
-                result[remove_y1:remove_y2, remove_x1:remove_x2, 0:3] = 255
-                result[remove_y1:remove_y2, remove_x1:remove_x2, 3] = 0
-                print(f"   Blanked region ({remove_x1},{remove_y1})-({remove_x2},{remove_y2})")
-
         else:
             # STACKED (faces close in X): Use vertical logic
             if face_y < kept_y:
@@ -866,46 +1135,59 @@ def remove_faces_except(image, keep_face_id, all_faces):
                 remove_x2 = w
                 print(f"   Stacked BELOW: remove y={unwanted_top:.1f}%-100% (full width)")
 
-            # Blank out the region
-            if remove_x2 > remove_x1 and remove_y2 > remove_y1:
-                result[remove_y1:remove_y2, remove_x1:remove_x2, 0:3] = 255
-                result[remove_y1:remove_y2, remove_x1:remove_x2, 3] = 0
-                print(f"   Blanked region ({remove_x1},{remove_y1})-({remove_x2},{remove_y2})")
+        # Blank out the region: BGR white, alpha 0. A filled cv2.rectangle
+        # writes all four channels in one clipped SIMD pass — ~14x faster than
+        # separate numpy writes to the BGR and alpha planes of the same slice.
+        if remove_x2 > remove_x1 and remove_y2 > remove_y1:
+            cv2.rectangle(result, (remove_x1, remove_y1), (remove_x2 - 1, remove_y2 - 1),
+                          (255, 255, 255, 0), thickness=-1)
+            print(f"   Blanked region ({remove_x1},{remove_y1})-({remove_x2},{remove_y2})")
 
     return result
 
 
 
-def remove_background(image):
+def _whiten_transparent(bgra, alpha):
+    """
+    Set BGR to white wherever alpha < 128, in place.
+    This ensures AI models don't "see through" transparency to original data.
+    A masked OpenCV OR instead of boolean fancy indexing: same pixels, but
+    ~0.5 ms instead of ~19 ms on a 2 MP photo.
+    """
+    bg_mask = cv2.compare(alpha, 128, cv2.CMP_LT)
+    cv2.bitwise_or(bgra, (255, 255, 255, 0), dst=bgra, mask=bg_mask)
+
+
+def remove_background(image, rgb_image=None):
     """
     Remove background from image using rembg (U2-Net) or MediaPipe fallback.
+    rgb_image: optional RGB copy of `image` (both backends consume RGB).
     Returns tuple: (image with transparent background (RGBA), binary mask)
     """
+    if rgb_image is None:
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
     # Try rembg first (better quality, includes heads properly).
     # get_rembg_session() builds U2-Net on first use and returns None if rembg
     # is missing or fails to load, in which case we fall through to MediaPipe.
     session = get_rembg_session()
     if session is not None:
         try:
-            # Convert BGR to RGB for PIL
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             pil_image = Image.fromarray(rgb_image)
 
             # Remove background using rembg
             result_pil = rembg_remove(pil_image, session=session)
 
-            # Convert back to numpy RGBA
-            result_rgba = np.array(result_pil)
-
-            # Convert RGBA to BGRA for OpenCV
-            bgra = cv2.cvtColor(result_rgba, cv2.COLOR_RGBA2BGRA)
+            # Convert back to numpy RGBA, then swap to BGRA for OpenCV in
+            # place: np.array already made a private copy of the PIL buffer.
+            bgra = np.array(result_pil)
+            cv2.cvtColor(bgra, cv2.COLOR_RGBA2BGRA, dst=bgra)
 
             # Extract binary mask from alpha channel
             binary_mask = bgra[:, :, 3]
 
             # Set RGB to white where background is removed (alpha < 128)
-            bg_mask = binary_mask < 128
-            bgra[bg_mask, 0:3] = 255  # BGR = white
+            _whiten_transparent(bgra, binary_mask)
 
             return bgra, binary_mask
         except Exception as e:
@@ -915,32 +1197,44 @@ def remove_background(image):
     if not MEDIAPIPE_AVAILABLE:
         return None, None
 
-    with mp_selfie_segmentation.SelfieSegmentation(model_selection=1) as segmentation:
-        # Convert BGR to RGB
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = segmentation.process(rgb_image)
+    # Segment a size-capped copy of the RGB frame. model_selection=1 is
+    # MediaPipe's LANDSCAPE model (144x256 input), already the cheaper of the
+    # two; 0 is the general 256x256 model. Don't "speed this up" by flipping it.
+    small = _shrink_for_mediapipe(rgb_image)
+    results = _mp_process('segmentation', small, model_selection=1)
 
-        # Get segmentation mask (0-1 float values)
-        mask = results.segmentation_mask
+    # Get segmentation mask (0-1 float values), back at full resolution. The
+    # model's own output is 256 px, so upsampling here loses nothing.
+    mask = results.segmentation_mask
+    if small is not rgb_image:
+        mask = cv2.resize(mask, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_LINEAR)
 
-        # Create binary mask with threshold
-        binary_mask = (mask > 0.5).astype(np.uint8) * 255
+    # Create binary mask with threshold. The comparison's bool buffer is
+    # reinterpreted as uint8 and scaled in place, and the blur writes back into
+    # it, so the mask costs one HxW allocation instead of four.
+    binary_mask = (mask > 0.5).view(np.uint8)
+    binary_mask *= 255
 
-        # Optional: Smooth the mask edges
-        binary_mask = cv2.GaussianBlur(binary_mask, (5, 5), 0)
+    # Optional: Smooth the mask edges. A 3x3 box filter: on a 0/255 mask it
+    # softens the same one-pixel stair-step as the old 5x5 Gaussian at about
+    # half the cost, and the alpha<128 cut below lands on the same contour.
+    cv2.boxFilter(binary_mask, -1, (3, 3), dst=binary_mask)
 
-        # Create 4-channel image (BGRA)
-        bgra = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    # Create 4-channel image (BGRA). cvtColor is kept on purpose: filling an
+    # np.empty BGRA from numpy slices measured ~4x slower than this SIMD copy.
+    # No reused/thread-local scratch buffer either: this array and the mask
+    # are returned and live on in the caller (across pool threads, while the
+    # same thread may already serve the next request), and a per-thread
+    # buffer would pin a max-size frame per worker in billed RSS.
+    bgra = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
 
-        # Apply mask to alpha channel
-        bgra[:, :, 3] = binary_mask
+    # Apply mask to alpha channel
+    bgra[:, :, 3] = binary_mask
 
-        # Set RGB to white where background is removed (alpha < 128)
-        # This ensures AI models don't "see through" transparency to original data
-        bg_mask = binary_mask < 128
-        bgra[bg_mask, 0:3] = 255  # BGR = white
+    # Set RGB to white where background is removed (alpha < 128)
+    _whiten_transparent(bgra, binary_mask)
 
-        return bgra, binary_mask
+    return bgra, binary_mask
 
 
 def get_body_bounds_from_mask(mask, padding_percent=0.05):
@@ -950,15 +1244,14 @@ def get_body_bounds_from_mask(mask, padding_percent=0.05):
     """
     h, w = mask.shape[:2]
 
-    # Find non-zero pixels (the person)
-    non_zero = cv2.findNonZero(mask)
+    # Bounding rectangle of the non-zero pixels (the person). boundingRect
+    # scans an 8-bit mask directly; going through findNonZero first built an
+    # Nx1x2 int32 point list (tens of MB on a full-body photo) just to feed it.
+    x, y, bw, bh = cv2.boundingRect(mask)
 
-    if non_zero is None:
+    if bw == 0 or bh == 0:
         return None
 
-    # Get bounding rectangle
-    x, y, bw, bh = cv2.boundingRect(non_zero)
-
     # Add small padding
     pad_x = int(bw * padding_percent)
     pad_y = int(bh * padding_percent)
@@ -983,15 +1276,8 @@ def add_padding_to_box(box, padding_percent=0.5):
     padding_percent: 0.5 means 50% extra on each side
     Box is in percentage 0-100 format.
     """
-    pad_x = box['width'] * padding_percent
-    pad_y = box['height'] * padding_percent
-
-    return {
-        'x': max(0, box['x'] - pad_x),
-        'y': max(0, box['y'] - pad_y),
-        'width': min(100 - max(0, box['x'] - pad_x), box['width'] + 2 * pad_x),
-        'height': min(100 - max(0, box['y'] - pad_y), box['height'] + 2 * pad_y)
-    }
+    p = padding_percent
+    return add_asymmetric_padding_to_box(box, top=p, bottom=p, left=p, right=p)
 
 
 def add_asymmetric_padding_to_box(box, top=0.5, bottom=0.5, left=0.3, right=0.3):
@@ -1045,7 +1331,153 @@ def crop_to_box(image, box, output_size=None):
     return cropped
 
 
-def process_photo(image_data, is_base64=True, selected_face_id=None, cached_faces=None):
+# Named cells of the avatar grids the embedding endpoints crop to:
+# grid -> (rows, cols, {name: (row, col)}). Built once; _grid_cell turns a cell
+# into pixel bounds per image instead of each endpoint rebuilding a dict of
+# absolute bounds on every request.
+_GRID_CELLS = {
+    2: (2, 2, {f'{r}-{c}': (i, j) for i, r in enumerate(('top', 'bottom'))
+               for j, c in enumerate(('left', 'right'))}),
+    3: (3, 3, {f'{r}-{c}': (i, j) for i, r in enumerate(('top', 'middle', 'bottom'))
+               for j, c in enumerate(('left', 'center', 'right'))}),
+    '3x4': (3, 4, {f'{r}-col{j + 1}': (i, j) for i, r in enumerate(('top', 'middle', 'bottom'))
+                   for j in range(4)}),
+}
+
+
+def _grid_key(grid_size):
+    """Map a request's grid_size (2, 3, '3x4' or 34) to its _GRID_CELLS key."""
+    if grid_size in ('3x4', 34):
+        return '3x4'
+    return 3 if grid_size == 3 else 2
+
+
+def _grid_cell(image, grid, name):
+    """
+    Crop `image` to the named cell of `grid` (a _GRID_CELLS key). Cells are
+    h // rows by w // cols; the last row and column absorb the remainder.
+    Unknown names return the image unchanged.
+    """
+    rows, cols, cells = _GRID_CELLS[grid]
+    if name not in cells:
+        return image
+    r, c = cells[name]
+    h, w = image.shape[:2]
+    ch, cw = h // rows, w // cols
+    y2 = h if r == rows - 1 else (r + 1) * ch
+    x2 = w if c == cols - 1 else (c + 1) * cw
+    return image[r * ch:y2, c * cw:x2]
+
+
+def _crop_face_padded(image, face_box, padding=0.15):
+    """Crop a detected face (percent box) with `padding` of the face size on each side."""
+    h, w = image.shape[:2]
+    x, y = face_box['x'] / 100, face_box['y'] / 100
+    fw, fh = face_box['width'] / 100, face_box['height'] / 100
+    y1 = int(max(0, y - fh * padding) * h)
+    x1 = int(max(0, x - fw * padding) * w)
+    y2 = int(min(1, y + fh * (1 + padding)) * h)
+    x2 = int(min(1, x + fw * (1 + padding)) * w)
+    return image[y1:y2, x1:x2]
+
+
+# Face thumbnail framing: more top for hair, less bottom to avoid shoulders.
+# top=50% for full hair, bottom=15% below chin, sides=25%. Applied through
+# add_asymmetric_padding_to_box rather than _crop_face_padded: when the top or
+# left padding runs past the image edge, it keeps the full padded size and
+# extends the crop down/right instead, so a face near the top of the photo
+# still gets a full-size thumbnail.
+_THUMB_PADDING = dict(top=0.50, bottom=0.15, left=0.25, right=0.25)
+
+
+# ── base64 via pybase64 (optional) ──────────────────────────────────────────
+# Every request decodes a multi-MB data URL and every response encodes one to
+# three images. pybase64 wraps libbase64's SIMD codecs and is several times
+# faster than binascii on buffers this size; same output, and the same lenient
+# decoding (non-alphabet characters are skipped). Without it, stdlib is used.
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
+
+def _b64decode_image(image_data):
+    """
+    Decode a base64 image string, with or without a `data:...;base64,` prefix.
+
+    Uploads are multi-MB strings. `image_data.split(',')[1]` built a list plus
+    a full copy of the payload, and base64.b64decode() then encoded that copy
+    to ASCII bytes again before decoding. Slicing once after find() and handing
+    the str straight to the decoder (both read ASCII str without converting)
+    keeps it to a single transient copy. Same lenient decoding as before.
+    """
+    idx = image_data.find(',')
+    if idx >= 0:
+        image_data = image_data[idx + 1:]
+    if pybase64 is not None:
+        return pybase64.b64decode(image_data)
+    return binascii.a2b_base64(image_data)
+
+
+def _decode_image(image_data, flags=cv2.IMREAD_COLOR):
+    """
+    Decode a base64 image string (data URL or raw) straight to a cv2 array.
+    Returns None if the bytes aren't a decodable image, like cv2.imdecode.
+
+    cv2.imdecode already runs libjpeg-turbo's SIMD decoder (see the JPEG entry
+    in docs/decisions.md); this just keeps the three-step decode in one place.
+    """
+    return cv2.imdecode(np.frombuffer(_b64decode_image(image_data), np.uint8), flags)
+
+
+def _b64encode(buffer):
+    """Base64-encode bytes or an encoded image buffer to a str (for data URLs / JSON)."""
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(buffer)
+    return base64.b64encode(buffer).decode('utf-8')
+
+
+# ── /analyze worker pool ────────────────────────────────────────────────────
+# /analyze returns up to three encoded images (face thumbnail JPEG, body JPEG,
+# body_no_bg PNG) and used to encode them one after another on the request
+# thread, where the PNG alone was the slowest step after rembg. cv2.imencode
+# releases the GIL, so the three encodes run side by side on this pool and the
+# request thread only waits for the slowest one. Everything submitted here is
+# collected before process_photo returns, so no work outlives its request or
+# its _analyze_slots slot. Tasks on this pool never submit to it themselves,
+# so it cannot deadlock on itself.
+_worker_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix='analyze')
+
+
+def _encode_data_url(img, ext, params):
+    """Encode an image with cv2.imencode. Returns (data URL, encoded byte count)."""
+    ok, buffer = cv2.imencode(ext, img, params)
+    if not ok:
+        raise ValueError(f"Failed to encode {ext}")
+    mime = 'image/png' if ext == '.png' else 'image/jpeg'
+    return f"data:{mime};base64,{_b64encode(buffer)}", len(buffer)
+
+
+def _fit_within(w, h, max_w, max_h):
+    """Target (w, h) that fits inside max_w x max_h keeping aspect, or None if it already fits."""
+    if w <= max_w and h <= max_h:
+        return None
+    scale = min(max_w / w, max_h / h)
+    return int(w * scale), int(h * scale)
+
+
+def _resize_and_encode(img, size, ext, params):
+    """
+    Downscale `img` to `size` (INTER_AREA; None = keep) and encode it.
+    Run on _worker_pool so the body crops' resizes overlap each other and the
+    encodes, instead of running back to back on the request thread.
+    """
+    if size is not None:
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return _encode_data_url(img, ext, params)
+
+
+def process_photo(image_data, selected_face_id=None, cached_faces=None):
     """
     Process uploaded photo - FAST version with multi-face support:
 
@@ -1060,28 +1492,16 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
        - Use the selected face
        - Remove non-selected faces from output
 
+    image_data is the base64 upload (data URL prefix optional).
     Returns dict with face_thumbnail, body_no_bg, and bounding boxes
     """
     # No shared temp file. The old code wrote input_<pid>.jpg — shared by every
     # waitress worker thread in the single process — so concurrent /analyze
     # requests overwrote each other's photo (a cross-user leak), and the JPEG
     # save also crashed on RGBA PNGs. Decode base64 straight from memory.
-    temp_input = None
-
     try:
-        # 1. DECODE IMAGE
-        if is_base64:
-            # Remove data URL prefix if present
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-
-            # Decode base64 in memory (handles RGBA/PNG, no disk round-trip)
-            image_bytes = base64.b64decode(image_data)
-            img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
-        else:
-            temp_input = image_data
-            # Load image with OpenCV from the provided path
-            img = cv2.imread(temp_input)
+        # 1. DECODE IMAGE - base64 in memory (handles RGBA/PNG, no disk round-trip)
+        img = _decode_image(image_data)
 
         if img is None:
             raise ValueError("Failed to load image")
@@ -1089,42 +1509,51 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
         img_h, img_w = img.shape[:2]
         print(f"[PHOTO] Processing image: {img_w}x{img_h}")
 
+        # Cap the working frame at MAX_IMAGE_DIM. Every output is far smaller
+        # (768px face thumbnail, 512x768 body) and all boxes are percentages,
+        # but a 12 MP phone photo held as BGR + RGB + RGBA and run through
+        # rembg at full size costs hundreds of MB per request. image_dimensions
+        # still reports the uploaded size.
+        img = _shrink_for_mediapipe(img, MAX_IMAGE_DIM)
+        if img.shape[:2] != (img_h, img_w):
+            print(f"[PHOTO] Capped to {img.shape[1]}x{img.shape[0]} (MAX_IMAGE_DIM={MAX_IMAGE_DIM})")
+
+        # Every model downstream (MTCNN/MediaPipe, rembg) consumes RGB; convert
+        # the full-resolution frame once instead of once per helper.
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
         # 2. DETECT FACES - scale while maintaining aspect ratio
         # IMPORTANT: Never distort the image - faces become undetectable when squished
         print("[FACE] Detecting faces...")
 
         aspect_ratio = img_h / img_w
-        detection_img = img
-
-        # Scale to max dimension 1200px while maintaining aspect ratio
-        max_dim = max(img_w, img_h)
-        if max_dim > 1200:
-            scale = 1200 / max_dim
-            new_w = int(img_w * scale)
-            new_h = int(img_h * scale)
-            detection_img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        # The detectors consume RGB, so downscale the RGB frame directly rather
+        # than resizing BGR and converting the result a second time.
+        # Scale to FACE_DETECT_MAX_DIM while maintaining aspect ratio
+        detection_rgb = _shrink_for_mediapipe(rgb, FACE_DETECT_MAX_DIM)
+        if detection_rgb is not rgb:
+            new_h, new_w = detection_rgb.shape[:2]
             print(f"[FACE] Scaled {img_w}x{img_h} -> {new_w}x{new_h} (aspect preserved: {aspect_ratio:.2f})")
         else:
             print(f"[FACE] Using original size {img_w}x{img_h} (aspect: {aspect_ratio:.2f})")
 
-        # (Removed dev-only debug image write to TEMP_DIR; in production this
-        # was overwriting a decoded copy of every uploaded photo on disk.)
-
         # Use cached faces if provided (from first call), otherwise detect
         # This prevents face ID instability between calls
         if cached_faces is not None and selected_face_id is not None:
             all_faces = cached_faces
             print(f"[FACE] Using {len(all_faces)} cached faces from previous detection")
         else:
-            all_faces = detect_all_faces_mediapipe(detection_img, min_confidence=0.15)
+            all_faces = detect_all_faces_mediapipe(detection_rgb, min_confidence=0.15)
 
             # Filter out tiny faces (likely false positives - hair tips, noise)
             # Real faces should be at least 3% of image width/height
             all_faces = [f for f in all_faces if f['width'] >= 3.0 and f['height'] >= 3.0]
 
-        # DEBUG: Draw detected faces on image and save
-        if len(all_faces) > 0:
-            debug_img = detection_img.copy()
+        # DEBUG: Draw detected faces on image and save. Opt-in only: this used to
+        # run on every upload, writing a decoded copy of each user's photo to
+        # disk (the removal noted above had missed this block).
+        if PHOTO_DEBUG_SAVE and len(all_faces) > 0:
+            debug_img = cv2.cvtColor(detection_rgb, cv2.COLOR_RGB2BGR)
             det_h, det_w = debug_img.shape[:2]
             for f in all_faces:
                 x1 = int(f['x'] * det_w / 100)
@@ -1133,9 +1562,15 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
                 y2 = int((f['y'] + f['height']) * det_h / 100)
                 cv2.rectangle(debug_img, (x1, y1), (x2, y2), (0, 255, 0), 2)
                 cv2.putText(debug_img, f"{f['confidence']*100:.0f}%", (x1, y1-5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-            debug_result_path = os.path.join(TEMP_DIR, 'debug_detection_result.jpg')
-            cv2.imwrite(debug_result_path, debug_img)
-            print(f"[DEBUG] Saved detection result to: {debug_result_path}")
+            # One uniquely named file per request: a fixed name was overwritten
+            # (or read half-written) by concurrent requests on other threads.
+            os.makedirs(TEMP_DIR, exist_ok=True)
+            ok, buffer = cv2.imencode('.jpg', debug_img)
+            if ok:
+                with tempfile.NamedTemporaryFile(dir=TEMP_DIR, prefix='debug_detection_',
+                                                 suffix='.jpg', delete=False) as tf:
+                    tf.write(buffer)
+                print(f"[DEBUG] Saved detection result to: {tf.name}")
 
         # Note: coordinates are percentages, so they map correctly to original image
         # Log each face with confidence AND position
@@ -1150,9 +1585,6 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
         # If no face detected, return error immediately
         if len(all_faces) == 0:
             print("[ERROR] No face detected in photo")
-            # Clean up temp files
-            if temp_input and os.path.exists(temp_input) and is_base64:
-                os.remove(temp_input)
             return {
                 "success": False,
                 "error": "no_face_detected",
@@ -1164,10 +1596,16 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
         if len(all_faces) > 1 and selected_face_id is None:
             print(f"[MULTI] Multiple faces detected ({len(all_faces)}), returning thumbnails for selection")
 
-            # Create thumbnails for each face (using original image for speed)
+            # Create thumbnails for each face (using original image for speed).
+            # Crop, resize and encode are OpenCV calls that release the GIL, so
+            # group photos build them side by side on the worker pool; map()
+            # keeps the results in face order. These are only shown in the
+            # face picker at 200px, where quality 85 looks the same as 90 and
+            # encodes and transfers smaller.
             face_thumbnails = []
-            for face in all_faces:
-                thumbnail = create_face_thumbnail(img, face, size=200)
+            thumbnails = _worker_pool.map(
+                lambda f: create_face_thumbnail(img, f, size=200, quality=85), all_faces)
+            for face, thumbnail in zip(all_faces, thumbnails):
                 if thumbnail:
                     face_thumbnails.append({
                         'id': face['id'],
@@ -1181,10 +1619,6 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
                         'thumbnail': thumbnail
                     })
 
-            # Clean up temp files
-            if temp_input and os.path.exists(temp_input) and is_base64:
-                os.remove(temp_input)
-
             return {
                 "success": True,
                 "multiple_faces_detected": True,
@@ -1215,11 +1649,14 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
         print("[BG] Removing background...")
         full_img_rgba = None
         body_mask = None
+        # Not started before detection: a no-face or multi-face photo returns
+        # early, and a cutout still running on _worker_pool would outlive both
+        # the response and the request's _analyze_slots slot.
         try:
-            full_img_rgba, body_mask = remove_background(img)
+            full_img_rgba, body_mask = remove_background(img, rgb)
             if full_img_rgba is not None:
                 h, w = full_img_rgba.shape[:2]
-                visible = np.sum(full_img_rgba[:,:,3] > 128)
+                visible = np.count_nonzero(full_img_rgba[:,:,3] > 128)
                 print(f"   Background removed: {visible}/{h*w} pixels visible ({100*visible/(h*w):.1f}%)")
             else:
                 print("   Background removal returned None")
@@ -1228,17 +1665,21 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
 
         # 6. REMOVE NON-SELECTED FACES (if multiple faces and one was selected)
         # Make them transparent so AI can't use them for avatar generation
+        alpha_mask = None
         if len(all_faces) > 1 and selected_face_id is not None:
             print(f"[REMOVE] Removing {len(all_faces) - 1} non-selected faces, keeping ID {selected_face_id}")
             print(f"[REMOVE] all_faces: {[(f.get('id'), f.get('x'), f.get('y')) for f in all_faces]}")
             if full_img_rgba is not None:
                 h, w = full_img_rgba.shape[:2]
-                visible_before = np.sum(full_img_rgba[:,:,3] > 0)
+                visible_before = cv2.countNonZero(cv2.extractChannel(full_img_rgba, 3))
                 print(f"[REMOVE] Before: {visible_before}/{h*w} pixels visible ({100*visible_before/(h*w):.1f}%)")
 
-                full_img_rgba = remove_faces_except(full_img_rgba, selected_face_id, all_faces)
+                # full_img_rgba is this request's own cutout; blank it in place
+                full_img_rgba = remove_faces_except(full_img_rgba, selected_face_id, all_faces, in_place=True)
 
-                visible_after = np.sum(full_img_rgba[:,:,3] > 0)
+                # Kept for step 7: the body bounds come from this same alpha
+                alpha_mask = cv2.extractChannel(full_img_rgba, 3)
+                visible_after = cv2.countNonZero(alpha_mask)
                 print(f"[REMOVE] After: {visible_after}/{h*w} pixels visible ({100*visible_after/(h*w):.1f}%)")
                 print("   Face removal complete")
 
@@ -1246,9 +1687,9 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
         # For multi-face: use alpha channel (only selected person is visible after remove_faces_except)
         # For single-face: use the segmentation mask
         body_box = None
-        if len(all_faces) > 1 and selected_face_id is not None and full_img_rgba is not None:
+        if alpha_mask is not None:
             # Multi-face: use alpha channel to find bounds of selected person
-            alpha_mask = full_img_rgba[:, :, 3]
+            # (one boundingRect pass over the contiguous channel from step 6)
             body_box = get_body_bounds_from_mask(alpha_mask, padding_percent=0.05)
             if body_box:
                 print(f"   Body box from alpha mask: x={body_box['x']:.1f}%, y={body_box['y']:.1f}%, w={body_box['width']:.1f}%, h={body_box['height']:.1f}%")
@@ -1268,37 +1709,24 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
             # Single person - use segmentation mask bounds
             body_box = get_body_bounds_from_mask(body_mask, padding_percent=0.05)
 
-        # 8. CREATE OUTPUTS
+        # 8. CREATE OUTPUTS (encodes are submitted to _worker_pool and collected below)
         face_thumbnail = None
         body_no_bg = None
         body_crop = None
+        face_future = body_no_bg_future = body_crop_future = None
 
         # Face thumbnail with background removed (768x768 for avatar generation)
         if face_box and full_img_rgba is not None:
             # Asymmetric padding: more top for hair, less bottom to avoid shoulders
-            face_box_padded = add_asymmetric_padding_to_box(face_box, top=0.50, bottom=0.15, left=0.25, right=0.25)
-            face_img = crop_to_box(full_img_rgba, face_box_padded)
+            face_img = crop_to_box(full_img_rgba, add_asymmetric_padding_to_box(face_box, **_THUMB_PADDING))
 
             if face_img.size > 0:
-                # Make it square with soft warm peach background
-                size = max(face_img.shape[0], face_img.shape[1])
-                # Create square with warm peach background (BGRA: B=230, G=240, R=255, A=255)
-                square = np.full((size, size, 4), [230, 240, 255, 255], dtype=np.uint8)
-                y_off = (size - face_img.shape[0]) // 2
-                x_off = (size - face_img.shape[1]) // 2
-
-                # Composite face onto background
-                face_region = square[y_off:y_off+face_img.shape[0], x_off:x_off+face_img.shape[1]]
-                alpha = face_img[:, :, 3:4] / 255.0
-                face_region[:, :, :3] = (face_img[:, :, :3] * alpha + face_region[:, :, :3] * (1 - alpha)).astype(np.uint8)
-                face_region[:, :, 3] = 255
-
-                # Resize to 768x768 (high quality for avatar generation)
-                face_thumb = cv2.resize(square, (768, 768), interpolation=cv2.INTER_LANCZOS4)
-                face_thumb_bgr = cv2.cvtColor(face_thumb, cv2.COLOR_BGRA2BGR)
-                _, buffer = cv2.imencode('.jpg', face_thumb_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                face_thumbnail = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
-                print("   Face thumbnail created (768x768)")
+                # Composite face onto the soft warm peach background, then
+                # resize and square it to 768x768 with a peach border (high
+                # quality for avatar generation)
+                face_thumb_bgr = _fit_square(_flatten_onto_peach(face_img), 768)
+                face_future = _worker_pool.submit(
+                    _encode_data_url, face_thumb_bgr, '.jpg', [cv2.IMWRITE_JPEG_QUALITY, 95])
 
         # Max dimensions for body images (efficient for avatar generation)
         max_w, max_h = 512, 768
@@ -1310,36 +1738,39 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
                 body_img_rgba = crop_to_box(full_img_rgba, body_box)
                 print(f"   Cropped body_no_bg to bounds")
             else:
-                body_img_rgba = full_img_rgba.copy()
+                # Nothing below writes to it (resize and encode both read), so
+                # the full frame is passed as is rather than copied.
+                body_img_rgba = full_img_rgba
                 print(f"   Using full image for body_no_bg (no body_box)")
 
             if body_img_rgba.size > 0:
                 bh, bw = body_img_rgba.shape[:2]
-                if bw > max_w or bh > max_h:
-                    scale = min(max_w/bw, max_h/bh)
-                    new_w, new_h = int(bw*scale), int(bh*scale)
-                    body_img_rgba = cv2.resize(body_img_rgba, (new_w, new_h), interpolation=cv2.INTER_AREA)
-                    print(f"   Resized body_no_bg from {bw}x{bh} to {new_w}x{new_h}")
+                fit = _fit_within(bw, bh, max_w, max_h)
+                if fit:
+                    print(f"   Resized body_no_bg from {bw}x{bh} to {fit[0]}x{fit[1]}")
 
-                # Encode as PNG with max compression (level 9) to preserve transparency
-                _, buffer_png = cv2.imencode('.png', body_img_rgba, [cv2.IMWRITE_PNG_COMPRESSION, 9])
-                body_no_bg = f"data:image/png;base64,{base64.b64encode(buffer_png).decode('utf-8')}"
-                print(f"   Body no-bg created: {len(buffer_png)//1024}KB")
+                # Encode as PNG to preserve transparency (PNG_COMPRESS_LEVEL).
+                body_no_bg_future = _worker_pool.submit(
+                    _resize_and_encode, body_img_rgba, fit, '.png',
+                    [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESS_LEVEL])
 
         # Also create body with background (for display)
         if body_box and img is not None:
             body_img = crop_to_box(img, body_box)
             if body_img.size > 0:
                 bh, bw = body_img.shape[:2]
-                if bw > max_w or bh > max_h:
-                    scale = min(max_w/bw, max_h/bh)
-                    body_img = cv2.resize(body_img, (int(bw*scale), int(bh*scale)), interpolation=cv2.INTER_AREA)
-                _, buffer = cv2.imencode('.jpg', body_img, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                body_crop = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
-
-        # Clean up temp files
-        if temp_input and os.path.exists(temp_input) and is_base64:
-            os.remove(temp_input)
+                body_crop_future = _worker_pool.submit(
+                    _resize_and_encode, body_img, _fit_within(bw, bh, max_w, max_h),
+                    '.jpg', [cv2.IMWRITE_JPEG_QUALITY, 85])
+
+        if face_future is not None:
+            face_thumbnail, _ = face_future.result()
+            print("   Face thumbnail created (768x768)")
+        if body_no_bg_future is not None:
+            body_no_bg, png_bytes = body_no_bg_future.result()
+            print(f"   Body no-bg created: {png_bytes//1024}KB")
+        if body_crop_future is not None:
+            body_crop, _ = body_crop_future.result()
 
         print("[OK] Photo processing complete")
 
@@ -1367,10 +1798,6 @@ def process_photo(image_data, is_base64=True, selected_face_id=None, cached_face
         }
 
     except Exception as e:
-        # Clean up on error
-        if temp_input and os.path.exists(temp_input) and is_base64:
-            os.remove(temp_input)
-
         return {
             "success": False,
             "error": str(e)
@@ -1404,11 +1831,7 @@ def remove_bg_endpoint():
         max_size = data.get('max_size', None)
 
         # Decode base64 image
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        img_bytes = base64.b64decode(image_data)
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        img = _decode_image(image_data)
 
         if img is None:
             return jsonify({"success": False, "error": "Failed to decode image"}), 400
@@ -1429,8 +1852,8 @@ def remove_bg_endpoint():
             return jsonify({"success": False, "error": "Background removal failed"}), 500
 
         # Encode as PNG (preserves transparency)
-        _, buffer = cv2.imencode('.png', result_rgba, [cv2.IMWRITE_PNG_COMPRESSION, 9])
-        result_base64 = f"data:image/png;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        _, buffer = cv2.imencode('.png', result_rgba, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESS_LEVEL])
+        result_base64 = f"data:image/png;base64,{_b64encode(buffer)}"
         print(f"[REMOVE-BG] Output: {len(buffer)//1024}KB PNG")
 
         return jsonify({
@@ -1482,11 +1905,7 @@ def silhouette_edge_endpoint():
         color_bgr = (int(color_rgb[2]), int(color_rgb[1]), int(color_rgb[0]))
         alpha = max(0, min(255, int(data.get('alpha', 255))))
 
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        img_bytes = base64.b64decode(image_data)
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        img = _decode_image(image_data)
         if img is None:
             return jsonify({"success": False, "error": "Failed to decode image"}), 400
 
@@ -1506,8 +1925,8 @@ def silhouette_edge_endpoint():
         out[binary, 2] = color_bgr[2]
         out[binary, 3] = alpha
 
-        _, buffer = cv2.imencode('.png', out, [cv2.IMWRITE_PNG_COMPRESSION, 9])
-        result_b64 = f"data:image/png;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        _, buffer = cv2.imencode('.png', out, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESS_LEVEL])
+        result_b64 = f"data:image/png;base64,{_b64encode(buffer)}"
         fill_pixels = int(binary.sum())
         print(f"[SILHOUETTE-EDGE] {w}x{h} crop, fill px={fill_pixels}, alpha={alpha}, out={len(buffer)//1024}KB")
         return jsonify({"success": True, "image": result_b64, "edge_pixels": fill_pixels, "fill_pixels": fill_pixels})
@@ -1673,10 +2092,7 @@ def figure_mask_endpoint():
         alpha = max(0, min(255, int(data.get('alpha', 255))))
 
         image_data = data['image']
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        img_array = np.frombuffer(base64.b64decode(image_data), np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        img = _decode_image(image_data)
         if img is None:
             return jsonify({"success": False, "error": "Failed to decode image"}), 400
         h, w = img.shape[:2]
@@ -1728,17 +2144,17 @@ def figure_mask_endpoint():
         out[binary, 2] = int(color_rgb[0])
         out[binary, 3] = alpha
 
-        _, buffer = cv2.imencode('.png', out, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        _, buffer = cv2.imencode('.png', out, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESS_LEVEL])
         fill_pixels = int(binary.sum())
         pts_str = f", points={prompt_kwargs.get('points')}" if 'points' in prompt_kwargs else ''
         payload = jsonify({
             "success": True,
-            "image": f"data:image/png;base64,{base64.b64encode(buffer).decode('utf-8')}",
+            "image": f"data:image/png;base64,{_b64encode(buffer)}",
             "fill_pixels": fill_pixels,
         })
         # Drop the big per-call intermediates, then hand freed RSS back to the OS
         # so this long-running process doesn't creep up into an OOM 500.
-        del results, res, m, union, binary, out, buffer, img, img_array
+        del results, res, m, union, binary, out, buffer, img
         # Our own locals are gone, but ultralytics still holds the run's tensors
         # on the predictor — that retention, not fragmentation, is what made RSS
         # climb ~300MB per call even with the trim below. Model stays loaded.
@@ -1889,9 +2305,7 @@ def detect_figures_text_endpoint():
         text_threshold = float(data.get('text_threshold', 0.20))
 
         image_data = data['image']
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        img_bgr = cv2.imdecode(np.frombuffer(base64.b64decode(image_data), np.uint8), cv2.IMREAD_COLOR)
+        img_bgr = _decode_image(image_data)
         if img_bgr is None:
             return jsonify({"success": False, "error": "Failed to decode image"}), 400
         h, w = img_bgr.shape[:2]
@@ -1949,6 +2363,30 @@ def detect_figures_text_endpoint():
 _warmup_thread = None
 
 
+def _warm_mp_graphs():
+    """
+    Build the cached MediaPipe graphs this environment's request paths will key
+    on, and push one blank frame through each, so the first request doesn't pay
+    graph construction + XNNPACK setup. The keys must match the _mp_process
+    calls exactly (_get_mp_graph caches per kind + params), so this mirrors the
+    detectors' own dispatch rather than warming a fixed list.
+    """
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    if MEDIAPIPE_AVAILABLE:
+        # detect_face_mediapipe: /split-grid, /extract-face, /face-embedding,
+        # /compare-identity
+        _mp_process('face', blank, model_selection=1, min_detection_confidence=0.5)
+        # /analyze (detect_all_faces_mediapipe), only when MTCNN is missing
+        if not MTCNN_AVAILABLE:
+            for model_type in (0, 1):
+                _mp_process('face', blank, model_selection=model_type, min_detection_confidence=0.1)
+        # remove_background's fallback when rembg is unavailable
+        _mp_process('segmentation', blank, model_selection=1)
+    elif MEDIAPIPE_TASKS_AVAILABLE and not MTCNN_AVAILABLE:
+        # /analyze on the Tasks API (detect_all_faces_mediapipe_tasks)
+        _mp_process('tasks_face', blank, min_detection_confidence=0.15)
+
+
 @app.route('/warmup', methods=['POST'])
 def warmup_endpoint():
     """Preload every model this environment will need, ahead of time.
@@ -1981,6 +2419,10 @@ def warmup_endpoint():
             get_mobilesam()
         except Exception as e:
             print(f"[WARMUP] mobilesam failed: {e}")
+        try:
+            _warm_mp_graphs()
+        except Exception as e:
+            print(f"[WARMUP] mediapipe failed: {e}")
         if want_dino:
             try:
                 get_groundingdino()
@@ -2026,6 +2468,12 @@ def release_memory_endpoint():
                 _rembg_session = None
                 rembg_remove = None
             unloaded.append('rembg')
+        with _analyze_cache_lock:
+            if _analyze_cache:
+                _analyze_cache.clear()
+                unloaded.append('analyze-cache')
+        if _close_mp_graphs():
+            unloaded.append('mediapipe')
     _release_memory()
     after = _rss_mb()
     freed = None if (before is None or after is None) else round(before - after, 1)
@@ -2114,6 +2562,36 @@ def health_check():
     return jsonify(body)
 
 
+# ── /analyze admission ──────────────────────────────────────────────────────
+# Every waitress thread can pick up an /analyze, and each one holds a decoded
+# full-resolution photo plus a rembg inference whose ONNX session already
+# spreads across all cores. Letting every thread run one at once just
+# time-slices the same cores: all of them finish late together and peak RSS is
+# the sum of all of them. A bounded semaphore lets a few run at full speed
+# while the rest wait their turn, which keeps p99 and memory predictable. The
+# other endpoints (SAM, DINO, LPIPS) are not gated by this.
+ANALYZE_CONCURRENCY = int(os.environ.get('ANALYZE_CONCURRENCY') or max(2, (os.cpu_count() or 4) // 2))
+_analyze_slots = threading.BoundedSemaphore(ANALYZE_CONCURRENCY)
+
+# Recent /analyze results keyed by a hash of (image, selected face, cached
+# faces). The upload flow retries on timeouts and the client re-posts the same
+# photo when the user backs out of face selection; those repeats now return
+# the stored result instead of running detection + rembg again. Successful
+# results only, and few of them — each holds ~100-400 KB of data URLs, and
+# Railway bills that RSS per minute. ANALYZE_CACHE_SIZE=0 disables it.
+ANALYZE_CACHE_SIZE = int(os.environ.get('ANALYZE_CACHE_SIZE', '16'))
+_analyze_cache = OrderedDict()
+_analyze_cache_lock = threading.Lock()
+
+
+def _analyze_cache_key(image_data, selected_face_id, cached_faces):
+    """blake2b over everything that determines the /analyze result."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(image_data.encode('utf-8'))
+    h.update(json.dumps([selected_face_id, cached_faces], sort_keys=True).encode('utf-8'))
+    return h.digest()
+
+
 @app.route('/analyze', methods=['POST'])
 def analyze_photo():
     """
@@ -2159,7 +2637,30 @@ def analyze_photo():
         selected_face_id = data.get('selected_face_id')  # None for initial, int after selection
         cached_faces = data.get('cached_faces')  # Face data from first call (prevents re-detection ID instability)
 
-        result = process_photo(image_data, is_base64=True, selected_face_id=selected_face_id, cached_faces=cached_faces)
+        cache_key = None
+        if ANALYZE_CACHE_SIZE > 0:
+            cache_key = _analyze_cache_key(image_data, selected_face_id, cached_faces)
+            with _analyze_cache_lock:
+                cached = _analyze_cache.get(cache_key)
+                if cached is not None:
+                    _analyze_cache.move_to_end(cache_key)
+            if cached is not None:
+                print("[ANALYZE] Returning cached result for a repeated upload")
+                return jsonify(cached), 200
+
+        queued_at = time.time()
+        with _analyze_slots:
+            waited = time.time() - queued_at
+            if waited > 1.0:
+                print(f"[ANALYZE] Waited {waited:.1f}s for a slot ({ANALYZE_CONCURRENCY} concurrent)")
+            result = process_photo(image_data, selected_face_id=selected_face_id, cached_faces=cached_faces)
+
+        if cache_key is not None and result['success']:
+            with _analyze_cache_lock:
+                _analyze_cache[cache_key] = result
+                _analyze_cache.move_to_end(cache_key)
+                while len(_analyze_cache) > ANALYZE_CACHE_SIZE:
+                    _analyze_cache.popitem(last=False)
 
         if result['success']:
             return jsonify(result), 200
@@ -2218,27 +2719,30 @@ def get_lpips_model():
 
 
 def decode_image_to_tensor(image_data):
-    """Decode base64 image to normalized tensor for LPIPS"""
-    import torch
-
-    # Remove data URL prefix if present
-    if ',' in image_data:
-        image_data = image_data.split(',')[1]
-
-    # Decode base64
-    image_bytes = base64.b64decode(image_data)
-    img_pil = Image.open(BytesIO(image_bytes)).convert('RGB')
+    """
+    Decode base64 image to normalized tensor for LPIPS.
 
-    # Convert to numpy, then to tensor
-    img_np = np.array(img_pil).astype(np.float32) / 255.0
+    Decoded with cv2 rather than PIL (IGNORE_ORIENTATION keeps PIL's behaviour
+    of not applying EXIF rotation). The uint8 frame is converted once: the
+    float copy already lands in [1, C, H, W] order, and scaling to [-1, 1]
+    happens in place on it, instead of three float passes plus a strided
+    permute over the full image.
+    """
+    import torch
 
-    # Normalize to [-1, 1] range (LPIPS requirement)
-    img_np = img_np * 2 - 1
+    # Decode base64 (data URL prefix stripped by the helper)
+    img_bgr = _decode_image(image_data, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img_bgr is None:
+        raise ValueError("Failed to decode image")
+    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
 
-    # Convert to tensor: [H, W, C] -> [1, C, H, W]
-    img_tensor = torch.from_numpy(img_np).permute(2, 0, 1).unsqueeze(0)
+    # [H, W, C] uint8 -> [1, C, H, W] float32, normalized to [-1, 1] (LPIPS requirement)
+    img_tensor = torch.from_numpy(img_rgb).permute(2, 0, 1).unsqueeze(0).to(
+        torch.float32, memory_format=torch.contiguous_format)
+    img_tensor.mul_(2.0 / 255.0).sub_(1.0)
 
-    return img_tensor, img_pil.size
+    height, width = img_rgb.shape[:2]
+    return img_tensor, (width, height)
 
 
 def crop_tensor_to_bbox(img_tensor, bbox, img_size):
@@ -2247,8 +2751,6 @@ def crop_tensor_to_bbox(img_tensor, bbox, img_size):
     bbox: [ymin, xmin, ymax, xmax] normalized 0.0-1.0
     img_size: (width, height)
     """
-    import torch
-
     width, height = img_size
     ymin, xmin, ymax, xmax = bbox
 
@@ -2275,6 +2777,17 @@ def crop_tensor_to_bbox(img_tensor, bbox, img_size):
     return cropped
 
 
+def _interpret_lpips(score):
+    """Bucket an LPIPS distance into the labels /lpips returns."""
+    if score < 0.05:
+        return "nearly_identical"
+    if score < 0.15:
+        return "very_similar"
+    if score < 0.30:
+        return "somewhat_similar"
+    return "different"
+
+
 @app.route('/lpips', methods=['POST'])
 def compare_lpips():
     """
@@ -2285,6 +2798,7 @@ def compare_lpips():
         "image1": "data:image/jpeg;base64,...",  # Original/reference image (face photo)
         "image2": "data:image/jpeg;base64,...",  # Generated/modified image (e.g., 2x2 grid)
         "bbox": [ymin, xmin, ymax, xmax],        # Optional: crop image2 to this region (0.0-1.0)
+        "bboxes": [[ymin, xmin, ymax, xmax], ...],  # Optional: score several image2 regions at once
         "resize_to": 256                          # Optional: resize for faster comparison
     }
 
@@ -2298,6 +2812,10 @@ def compare_lpips():
         "interpretation": "very_similar",
         "region": "full" or "cropped"
     }
+
+    With "bboxes", image1 is compared against every region in one batched
+    forward pass and the response carries "lpips_scores" / "interpretations"
+    lists (same order as bboxes) with region "cropped_img2_batch".
     """
     try:
         model = get_lpips_model()
@@ -2307,7 +2825,11 @@ def compare_lpips():
                 "error": "LPIPS not available. Install with: pip install lpips torch torchvision"
             }), 503
 
+        # Imported here, not at module level: torch is ~200 MB of RSS that
+        # boot would otherwise pay even when /lpips is never called (see
+        # _boot_mark). After the first call these are sys.modules hits.
         import torch
+        import torch.nn.functional as F
 
         data = request.get_json()
         if not data or 'image1' not in data or 'image2' not in data:
@@ -2320,6 +2842,43 @@ def compare_lpips():
         img1_tensor, img1_size = decode_image_to_tensor(data['image1'])
         img2_tensor, img2_size = decode_image_to_tensor(data['image2'])
 
+        # Optional: several image2 regions (e.g. all four cells of a 2x2 grid)
+        # scored against image1 as one batch. AlexNet runs the batch dimension
+        # inside the same conv calls, instead of one request and forward pass
+        # per region.
+        bboxes = data.get('bboxes')
+        if bboxes:
+            if not all(isinstance(b, list) and len(b) == 4 for b in bboxes):
+                return jsonify({
+                    "success": False,
+                    "error": "'bboxes' must be a list of [ymin, xmin, ymax, xmax]"
+                }), 400
+
+            resize_to = data.get('resize_to')
+            size = (resize_to, resize_to) if resize_to else tuple(img1_tensor.shape[2:])
+            if tuple(img1_tensor.shape[2:]) != size:
+                img1_tensor = F.interpolate(img1_tensor, size=size, mode='bilinear', align_corners=False)
+
+            crops = []
+            for b in bboxes:
+                crop = crop_tensor_to_bbox(img2_tensor, b, img2_size)
+                if tuple(crop.shape[2:]) != size:
+                    crop = F.interpolate(crop, size=size, mode='bilinear', align_corners=False)
+                crops.append(crop)
+
+            with torch.inference_mode():
+                scores = model(img1_tensor.expand(len(crops), -1, -1, -1),
+                               torch.cat(crops, dim=0)).flatten().tolist()
+
+            return jsonify({
+                "success": True,
+                "lpips_scores": [round(sc, 4) for sc in scores],
+                "interpretations": [_interpret_lpips(sc) for sc in scores],
+                "region": "cropped_img2_batch",
+                "image1_size": list(img1_size),
+                "image2_size": list(img2_size)
+            }), 200
+
         region = "full"
 
         # Optional: crop to bounding box
@@ -2338,40 +2897,28 @@ def compare_lpips():
             img2_tensor = crop_tensor_to_bbox(img2_tensor, bbox, img2_size)
             region = "cropped_img2"
 
-        # Optional: resize for faster comparison
+        # Bring both to one size: resize_to if given (faster comparison),
+        # otherwise image1's. Each tensor is interpolated at most once, and
+        # not at all when it is already that size.
         resize_to = data.get('resize_to')
-        if resize_to:
-            import torch.nn.functional as F
-            img1_tensor = F.interpolate(img1_tensor, size=(resize_to, resize_to), mode='bilinear', align_corners=False)
-            img2_tensor = F.interpolate(img2_tensor, size=(resize_to, resize_to), mode='bilinear', align_corners=False)
-
-        # Ensure same size (resize img2 to match img1 if needed)
-        if img1_tensor.shape != img2_tensor.shape:
-            import torch.nn.functional as F
-            img2_tensor = F.interpolate(img2_tensor, size=img1_tensor.shape[2:], mode='bilinear', align_corners=False)
+        size = (resize_to, resize_to) if resize_to else tuple(img1_tensor.shape[2:])
+        if tuple(img1_tensor.shape[2:]) != size:
+            img1_tensor = F.interpolate(img1_tensor, size=size, mode='bilinear', align_corners=False)
+        if tuple(img2_tensor.shape[2:]) != size:
+            img2_tensor = F.interpolate(img2_tensor, size=size, mode='bilinear', align_corners=False)
 
         # (Removed dev-only debug image writes to test-results/; in production
         # the directory doesn't exist and the writes silently failed, but if
         # ever created they'd persist decoded comparison images on disk.)
 
-        # Compute LPIPS
-        with torch.no_grad():
+        # Compute LPIPS (CPU; inference_mode also skips autograd's version counters)
+        with torch.inference_mode():
             lpips_score = model(img1_tensor, img2_tensor).item()
 
-        # Interpret score
-        if lpips_score < 0.05:
-            interpretation = "nearly_identical"
-        elif lpips_score < 0.15:
-            interpretation = "very_similar"
-        elif lpips_score < 0.30:
-            interpretation = "somewhat_similar"
-        else:
-            interpretation = "different"
-
         return jsonify({
             "success": True,
             "lpips_score": round(lpips_score, 4),
-            "interpretation": interpretation,
+            "interpretation": _interpret_lpips(lpips_score),
             "region": region,
             "image1_size": list(img1_size),
             "image2_size": list(img2_size)
@@ -2416,12 +2963,8 @@ def split_grid():
 
         # Decode base64 image
         image_data = data['image']
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
 
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = _decode_image(image_data)
 
         if image is None:
             return jsonify({
@@ -2439,20 +2982,14 @@ def split_grid():
         # Find horizontal separator: row with lowest variance in the middle 60% of image
         search_h_start = int(height * 0.3)
         search_h_end = int(height * 0.7)
-        row_variances = []
-        for y in range(search_h_start, search_h_end):
-            row_variances.append((np.var(gray[y, :].astype(float)), y))
-        row_variances.sort()
-        mid_h = row_variances[0][1] if row_variances else height // 2
+        row_variances = _line_variances(gray, 'horizontal', search_h_start, search_h_end)
+        mid_h = search_h_start + int(np.argmin(row_variances)) if row_variances.size else height // 2
 
         # Find vertical separator: column with lowest variance in the middle 60%
         search_w_start = int(width * 0.3)
         search_w_end = int(width * 0.7)
-        col_variances = []
-        for x in range(search_w_start, search_w_end):
-            col_variances.append((np.var(gray[:, x].astype(float)), x))
-        col_variances.sort()
-        mid_w = col_variances[0][1] if col_variances else width // 2
+        col_variances = _line_variances(gray, 'vertical', search_w_start, search_w_end)
+        mid_w = search_w_start + int(np.argmin(col_variances)) if col_variances.size else width // 2
 
         print(f"[SPLIT-GRID] {width}x{height}, detected grid at x={mid_w} y={mid_h}")
 
@@ -2468,7 +3005,7 @@ def split_grid():
         # If head is cut off, expand upward to include it.
         for body_key in ['bodyFront', 'bodyProfile']:
             body_img = quadrants[body_key]
-            face = detect_face_mediapipe(body_img)
+            face = detect_face_mediapipe(body_img, max_dim=SPLIT_GRID_PROBE_DIM)
             if face and face['y'] < 5:
                 # Face is at very top edge — likely cut off. Expand upward.
                 col_start = 0 if body_key == 'bodyFront' else mid_w
@@ -2485,37 +3022,35 @@ def split_grid():
                 quadrants[body_key] = image[expanded_top:height, col_start:col_end]
                 print(f"[SPLIT-GRID] {body_key}: no face detected, expanded from y={expanded_top}")
 
-        # Encode each quadrant as base64 JPEG
-        encoded_quadrants = {}
-        for name, quad in quadrants.items():
-            _, buffer = cv2.imencode('.jpg', quad, [cv2.IMWRITE_JPEG_QUALITY, 90])
-            encoded_quadrants[name] = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        # Encode the four quadrants as base64 JPEG on the worker pool
+        # (cv2.imencode releases the GIL); they run while the face thumbnail
+        # below is detected and encoded on this thread.
+        quadrant_futures = {
+            name: _worker_pool.submit(_encode_data_url, quad, '.jpg', [cv2.IMWRITE_JPEG_QUALITY, 90])
+            for name, quad in quadrants.items()
+        }
 
         # Extract face from top-left quadrant (faceFront)
         face_thumbnail = None
         face_front = quadrants['faceFront']
 
         # Try MediaPipe first, fall back to OpenCV
-        face_box = detect_face_mediapipe(face_front)
+        face_box = detect_face_mediapipe(face_front, max_dim=SPLIT_GRID_PROBE_DIM)
 
         if face_box:
             face_thumbnail = create_face_thumbnail(face_front, face_box, size=768)
         else:
             # If no face detected, use the whole faceFront quadrant resized to square
-            h, w = face_front.shape[:2]
-            max_dim = max(h, w)
-            square = np.full((max_dim, max_dim, 3), [230, 240, 255], dtype=np.uint8)
-            y_off = (max_dim - h) // 2
-            x_off = (max_dim - w) // 2
-            square[y_off:y_off+h, x_off:x_off+w] = face_front
-            thumbnail = cv2.resize(square, (768, 768), interpolation=cv2.INTER_LANCZOS4)
+            thumbnail = _fit_square(face_front, 768)
             _, buffer = cv2.imencode('.jpg', thumbnail, [cv2.IMWRITE_JPEG_QUALITY, 90])
-            face_thumbnail = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+            face_thumbnail = f"data:image/jpeg;base64,{_b64encode(buffer)}"
 
         thumb_kb = round(len(face_thumbnail) / 1024) if face_thumbnail else 0
         face_info = f"detected at {face_box['x']:.0f}%,{face_box['y']:.0f}%" if face_box else "not detected"
         print(f"[SPLIT-GRID] Face: {face_info}, thumbnail: {thumb_kb}KB")
 
+        encoded_quadrants = {name: fut.result()[0] for name, fut in quadrant_futures.items()}
+
         return jsonify({
             "success": True,
             "quadrants": encoded_quadrants,
@@ -2530,6 +3065,17 @@ def split_grid():
         }), 500
 
 
+def _line_variances(gray, axis, start, end):
+    """Variance of every row ('horizontal') or column ('vertical') in [start, end).
+
+    One reduction over the band instead of an np.var call per line; on a
+    2048px sheet that is ~800 Python-level calls and float copies saved.
+    """
+    if axis == 'horizontal':
+        return gray[start:end, :].var(axis=1, dtype=np.float64)
+    return gray[:, start:end].var(axis=0, dtype=np.float64)
+
+
 def _detect_separators(gray, axis, num_separators, search_range=(0.15, 0.85)):
     """
     Detect the N strongest separator lines along the given axis using variance.
@@ -2551,30 +3097,23 @@ def _detect_separators(gray, axis, num_separators, search_range=(0.15, 0.85)):
     if num_separators <= 0:
         return []
 
-    if axis == 'horizontal':
-        # Find rows
-        dim = gray.shape[0]
-        start = int(dim * search_range[0])
-        end = int(dim * search_range[1])
-        variances = [(np.var(gray[y, :].astype(float)), y) for y in range(start, end)]
-    else:
-        # Find columns
-        dim = gray.shape[1]
-        start = int(dim * search_range[0])
-        end = int(dim * search_range[1])
-        variances = [(np.var(gray[:, x].astype(float)), x) for x in range(start, end)]
+    dim = gray.shape[0] if axis == 'horizontal' else gray.shape[1]
+    start = int(dim * search_range[0])
+    end = int(dim * search_range[1])
+    variances = _line_variances(gray, axis, start, end)
 
-    if not variances:
+    if not variances.size:
         return [dim // (num_separators + 1) * (i + 1) for i in range(num_separators)]
 
-    # Sort by variance (ascending — lowest variance = most uniform = separator)
-    variances.sort()
+    # Sort by variance (ascending — lowest variance = most uniform = separator).
+    # Stable sort keeps ties in coordinate order, as the old tuple sort did.
+    order = np.argsort(variances, kind='stable')
 
     # Greedy pick: take lowest-variance candidates that are at least
     # min_spacing apart from each other.
     min_spacing = int(dim * 0.15)  # at least 15% of dimension between separators
     picked = []
-    for _, coord in variances:
+    for coord in (start + order).tolist():
         if all(abs(coord - p) >= min_spacing for p in picked):
             picked.append(coord)
             if len(picked) >= num_separators:
@@ -2631,11 +3170,7 @@ def split_reference_sheet():
 
         # Decode base64 image
         image_data = data['image']
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = _decode_image(image_data)
 
         if image is None:
             return jsonify({
@@ -2693,7 +3228,7 @@ def split_reference_sheet():
                     print(f"[SPLIT-REFSHEET] Cell {len(cells)} encode failed")
                     cells.append(None)
                     continue
-                cells.append(base64.b64encode(encoded.tobytes()).decode('utf-8'))
+                cells.append(_b64encode(encoded.tobytes()))
             if len(cells) >= count:
                 break
 
@@ -2741,12 +3276,8 @@ def crop_front_column():
             return jsonify({"success": False, "error": "Missing 'image'"}), 400
 
         image_data = data['image']
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
 
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = _decode_image(image_data)
 
         if image is None:
             return jsonify({"success": False, "error": "Failed to decode image"}), 400
@@ -2757,18 +3288,15 @@ def crop_front_column():
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         search_w_start = int(width * 0.3)
         search_w_end = int(width * 0.7)
-        col_variances = []
-        for x in range(search_w_start, search_w_end):
-            col_variances.append((np.var(gray[:, x].astype(float)), x))
-        col_variances.sort()
-        mid_w = col_variances[0][1] if col_variances else width // 2
+        col_variances = _line_variances(gray, 'vertical', search_w_start, search_w_end)
+        mid_w = search_w_start + int(np.argmin(col_variances)) if col_variances.size else width // 2
 
         print(f"[CROP-FRONT] {width}x{height}, separator at x={mid_w} ({mid_w*100/width:.0f}%)")
 
         # Crop left column
         left_col = image[0:height, 0:mid_w]
         _, buffer = cv2.imencode('.jpg', left_col, [cv2.IMWRITE_JPEG_QUALITY, 92])
-        result_b64 = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        result_b64 = f"data:image/jpeg;base64,{_b64encode(buffer)}"
 
         return jsonify({
             "success": True,
@@ -2808,10 +3336,8 @@ def add_background():
 
         # Decode base64 image
         image_data = data['image']
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
 
-        image_bytes = base64.b64decode(image_data)
+        image_bytes = _b64decode_image(image_data)
 
         # Open with PIL to handle transparency
         pil_image = Image.open(BytesIO(image_bytes))
@@ -2833,7 +3359,7 @@ def add_background():
         # Encode as JPEG
         buffer = BytesIO()
         pil_image.save(buffer, format='JPEG', quality=95)
-        encoded = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        encoded = _b64encode(buffer.getvalue())
 
         return jsonify({
             "success": True,
@@ -2882,12 +3408,8 @@ def extract_face():
 
         # Decode base64 image
         image_data = data['image']
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
 
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = _decode_image(image_data)
 
         if image is None:
             return jsonify({
@@ -2902,20 +3424,10 @@ def extract_face():
         print(f"[EXTRACT-FACE] Input: {width}x{height}, quadrant: {quadrant}")
 
         # Crop to quadrant if specified
-        if quadrant:
-            mid_h = height // 2
-            mid_w = width // 2
-            quadrant_map = {
-                'top-left': (0, mid_h, 0, mid_w),
-                'top-right': (0, mid_h, mid_w, width),
-                'bottom-left': (mid_h, height, 0, mid_w),
-                'bottom-right': (mid_h, height, mid_w, width)
-            }
-            if quadrant in quadrant_map:
-                y1, y2, x1, x2 = quadrant_map[quadrant]
-                image = image[y1:y2, x1:x2]
-                height, width = image.shape[:2]
-                print(f"[EXTRACT-FACE] Cropped to {quadrant}: {width}x{height}")
+        if quadrant in _GRID_CELLS[2][2]:
+            image = _grid_cell(image, 2, quadrant)
+            height, width = image.shape[:2]
+            print(f"[EXTRACT-FACE] Cropped to {quadrant}: {width}x{height}")
 
         # Detect face
         face_box = detect_face_mediapipe(image)
@@ -2954,19 +3466,17 @@ def extract_face():
 
             face_img = image[y1:y2, x1:x2]
 
-            # Make square and resize
-            h, w = face_img.shape[:2]
-            max_dim = max(h, w)
-            square = np.full((max_dim, max_dim, 3), [230, 240, 255], dtype=np.uint8)  # Peach background
-            y_off = (max_dim - h) // 2
-            x_off = (max_dim - w) // 2
-            square[y_off:y_off+h, x_off:x_off+w] = face_img
+            # Make square (peach background) and resize. Deliberately NOT
+            # _fit_square: these crops are scored with LPIPS against each
+            # other, and the thresholds were calibrated on Lanczos output —
+            # a different kernel shifts every distance.
+            square = _pad_to_square(face_img)
 
             face_resized = cv2.resize(square, (output_size, output_size), interpolation=cv2.INTER_LANCZOS4)
 
             # Encode as JPEG
             _, buffer = cv2.imencode('.jpg', face_resized, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            face_base64 = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+            face_base64 = f"data:image/jpeg;base64,{_b64encode(buffer)}"
 
             print(f"[EXTRACT-FACE] Face extracted: {output_size}x{output_size}")
 
@@ -2987,10 +3497,11 @@ def extract_face():
             x1 = (width - min_dim) // 2
             center_crop = image[y1:y1+min_dim, x1:x1+min_dim]
 
+            # Lanczos for the same LPIPS-calibration reason as above
             face_resized = cv2.resize(center_crop, (output_size, output_size), interpolation=cv2.INTER_LANCZOS4)
 
             _, buffer = cv2.imencode('.jpg', face_resized, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            face_base64 = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+            face_base64 = f"data:image/jpeg;base64,{_b64encode(buffer)}"
 
             return jsonify({
                 "success": True,
@@ -3007,10 +3518,40 @@ def extract_face():
         }), 500
 
 
-# DeepFace for ArcFace embeddings (lazy loaded)
-_deepface_loaded = False
+# DeepFace for ArcFace embeddings (lazy loaded). DeepFace.represent() looks
+# the model up in DeepFace's own registry and builds it there on first use;
+# building it once here, under a lock, keeps concurrent first requests from
+# each constructing the Keras graph, and every represent() after that is a
+# registry hit. Not pre-warmed: nothing on the Node side calls the ArcFace
+# endpoints, so loading it in /warmup would only add resident memory.
+_arcface_model = None
+_arcface_lock = threading.Lock()
+
+
+def get_arcface_model():
+    """Build (or reuse) DeepFace's ArcFace model. Raises ImportError without deepface."""
+    global _arcface_model
+    if _arcface_model is not None:
+        return _arcface_model
+    with _arcface_lock:
+        if _arcface_model is None:  # re-check under the lock
+            from deepface import DeepFace
+            print("[ARCFACE] Loading ArcFace model via DeepFace...")
+            model = DeepFace.build_model('ArcFace')
+            # One blank forward pass so TensorFlow traces the graph now, not
+            # inside the first caller's request.
+            try:
+                DeepFace.represent(img_path=np.zeros((112, 112, 3), dtype=np.uint8),
+                                   model_name='ArcFace', enforce_detection=False,
+                                   detector_backend='skip')
+            except Exception as e:
+                print(f"[ARCFACE] Warm-up pass failed: {e}")
+            _arcface_model = model
+            print(f"[ARCFACE] ArcFace loaded — RSS now {_rss_mb()} MB")
+    return _arcface_model
+
 
-def get_arcface_embedding(image_path_or_array, assume_face_crop=False):
+def get_arcface_embedding(image_path_or_array, assume_face_crop=False, detection_tried=False):
     """
     Extract 512-D ArcFace embedding using DeepFace.
     ArcFace is style-invariant - can match photo to cartoon.
@@ -3018,25 +3559,35 @@ def get_arcface_embedding(image_path_or_array, assume_face_crop=False):
     Args:
         image_path_or_array: Either a file path or numpy array (BGR)
         assume_face_crop: If True, skip face detection (input is already a face)
+        detection_tried: If True, the caller already ran detect_face_mediapipe
+            on this exact image and it found nothing, so the MediaPipe pass
+            here is skipped (it would only miss again)
 
     Returns:
         tuple: (512-dimensional normalized embedding, face_detected boolean)
     """
-    global _deepface_loaded
-
     try:
         from deepface import DeepFace
 
-        if not _deepface_loaded:
-            print("[ARCFACE] Loading ArcFace model via DeepFace...")
-            _deepface_loaded = True
+        get_arcface_model()
 
         face_detected = False
 
         # Strategy:
         # 1. If assume_face_crop=True, skip detection entirely
-        # 2. Otherwise, try detection with opencv first
-        # 3. If that fails, try with skip (assume input is face)
+        # 2. Otherwise, crop with the cached MediaPipe detector and skip
+        #    DeepFace's own detector (its opencv backend is a full Haar pass),
+        #    unless the caller's own MediaPipe pass already missed
+        # 3. If MediaPipe finds nothing, try detection with opencv
+        # 4. If that fails, try with skip (assume input is face)
+
+        if not assume_face_crop and not detection_tried and isinstance(image_path_or_array, np.ndarray):
+            face_box = detect_face_mediapipe(image_path_or_array)
+            if face_box:
+                face_crop = _crop_face_padded(image_path_or_array, face_box)
+                if face_crop.size > 0:
+                    image_path_or_array = face_crop
+                    assume_face_crop = True
 
         if assume_face_crop:
             # Input is already a face crop - skip detection
@@ -3084,20 +3635,21 @@ def get_arcface_embedding(image_path_or_array, assume_face_crop=False):
         return None, False
 
 
-def extract_embedding_from_image(image_data, assume_face_crop=False):
+def extract_embedding_from_image(image_data, assume_face_crop=False, detection_tried=False):
     """
     Extract face embedding from image data (base64, PIL Image, or numpy array).
+    assume_face_crop / detection_tried: see get_arcface_embedding.
     Returns tuple: (512-dimensional normalized ArcFace embedding, face_detected boolean)
     """
     # Handle base64 input
     if isinstance(image_data, str):
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        img_pil = Image.open(BytesIO(image_bytes)).convert('RGB')
-        img_np = np.array(img_pil)
-        # Convert RGB to BGR for OpenCV/DeepFace
-        img_np = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+        # Decode straight to BGR with OpenCV's libjpeg-turbo instead of
+        # PIL decode -> RGB array -> cvtColor. IMREAD_COLOR also applies the
+        # EXIF orientation, which the PIL path silently ignored.
+        img_np = _decode_image(image_data)
+        if img_np is None:
+            print("[ARCFACE] Failed to decode image")
+            return None, False
     elif hasattr(image_data, 'convert'):
         # PIL Image
         img_pil = image_data.convert('RGB')
@@ -3107,7 +3659,22 @@ def extract_embedding_from_image(image_data, assume_face_crop=False):
         # Assume numpy array (BGR)
         img_np = image_data
 
-    return get_arcface_embedding(img_np, assume_face_crop=assume_face_crop)
+    return get_arcface_embedding(img_np, assume_face_crop=assume_face_crop,
+                                 detection_tried=detection_tried)
+
+
+def _cosine_similarity(a, b):
+    """
+    Cosine similarity of two embedding vectors.
+
+    ArcFace embeddings from get_arcface_embedding are already unit length, but
+    /compare-identity also takes client-supplied vectors, so both are
+    normalized here. Three np.vdot reductions replace two np.linalg.norm calls
+    plus two normalized copies of each vector.
+    """
+    a = np.asarray(a, dtype=np.float64).ravel()
+    b = np.asarray(b, dtype=np.float64).ravel()
+    return float(np.vdot(a, b) / np.sqrt(np.vdot(a, a) * np.vdot(b, b)))
 
 
 @app.route('/face-embedding', methods=['POST'])
@@ -3149,14 +3716,7 @@ def get_face_embedding():
         # If we need to extract face first, use the /extract-face logic
         if extract_face_flag or quadrant:
             # Decode image
-            if ',' in image_data:
-                image_data_clean = image_data.split(',')[1]
-            else:
-                image_data_clean = image_data
-
-            image_bytes = base64.b64decode(image_data_clean)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image = _decode_image(image_data)
 
             if image is None:
                 return jsonify({
@@ -3170,52 +3730,8 @@ def get_face_embedding():
             if quadrant:
                 grid_size = data.get('grid_size', 2)
 
-                if grid_size == '3x4' or grid_size == 34:
-                    # 3 rows, 4 columns
-                    third_h = height // 3
-                    fourth_w = width // 4
-                    quadrant_map = {
-                        'top-col1': (0, third_h, 0, fourth_w),
-                        'top-col2': (0, third_h, fourth_w, 2*fourth_w),
-                        'top-col3': (0, third_h, 2*fourth_w, 3*fourth_w),
-                        'top-col4': (0, third_h, 3*fourth_w, width),
-                        'middle-col1': (third_h, 2*third_h, 0, fourth_w),
-                        'middle-col2': (third_h, 2*third_h, fourth_w, 2*fourth_w),
-                        'middle-col3': (third_h, 2*third_h, 2*fourth_w, 3*fourth_w),
-                        'middle-col4': (third_h, 2*third_h, 3*fourth_w, width),
-                        'bottom-col1': (2*third_h, height, 0, fourth_w),
-                        'bottom-col2': (2*third_h, height, fourth_w, 2*fourth_w),
-                        'bottom-col3': (2*third_h, height, 2*fourth_w, 3*fourth_w),
-                        'bottom-col4': (2*third_h, height, 3*fourth_w, width)
-                    }
-                elif grid_size == 3:
-                    third_h = height // 3
-                    third_w = width // 3
-                    quadrant_map = {
-                        'top-left': (0, third_h, 0, third_w),
-                        'top-center': (0, third_h, third_w, 2*third_w),
-                        'top-right': (0, third_h, 2*third_w, width),
-                        'middle-left': (third_h, 2*third_h, 0, third_w),
-                        'middle-center': (third_h, 2*third_h, third_w, 2*third_w),
-                        'middle-right': (third_h, 2*third_h, 2*third_w, width),
-                        'bottom-left': (2*third_h, height, 0, third_w),
-                        'bottom-center': (2*third_h, height, third_w, 2*third_w),
-                        'bottom-right': (2*third_h, height, 2*third_w, width)
-                    }
-                else:
-                    mid_h = height // 2
-                    mid_w = width // 2
-                    quadrant_map = {
-                        'top-left': (0, mid_h, 0, mid_w),
-                        'top-right': (0, mid_h, mid_w, width),
-                        'bottom-left': (mid_h, height, 0, mid_w),
-                        'bottom-right': (mid_h, height, mid_w, width)
-                    }
-                    
-                if quadrant in quadrant_map:
-                    y1, y2, x1, x2 = quadrant_map[quadrant]
-                    image = image[y1:y2, x1:x2]
-                    height, width = image.shape[:2]
+                image = _grid_cell(image, _grid_key(grid_size), quadrant)
+                height, width = image.shape[:2]
 
             # Detect and crop face
             if extract_face_flag:
@@ -3223,25 +3739,14 @@ def get_face_embedding():
                 if face_box:
                     face_detected = True
                     # Add padding and crop
-                    padding = 0.15
-                    x = face_box['x'] / 100
-                    y = face_box['y'] / 100
-                    w = face_box['width'] / 100
-                    h = face_box['height'] / 100
-
-                    y1 = int(max(0, y - h * padding) * height)
-                    x1 = int(max(0, x - w * padding) * width)
-                    y2 = int(min(1, y + h * (1 + padding)) * height)
-                    x2 = int(min(1, x + w * (1 + padding)) * width)
-
-                    image = image[y1:y2, x1:x2]
-
-            # Convert to PIL for embedding extraction
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            img_pil = Image.fromarray(image_rgb)
-
-            # If we extracted a face, tell ArcFace to skip detection
-            embedding, arcface_detected = extract_embedding_from_image(img_pil, assume_face_crop=face_detected)
+                    image = _crop_face_padded(image, face_box)
+
+            # Hand the BGR crop straight over (a PIL detour converted it to RGB
+            # only for extract_embedding_from_image to convert it back).
+            # If we extracted a face, tell ArcFace to skip detection; if our
+            # MediaPipe pass missed, tell it not to repeat that pass
+            embedding, arcface_detected = extract_embedding_from_image(
+                image, assume_face_crop=face_detected, detection_tried=extract_face_flag)
             face_detected = face_detected or arcface_detected
         else:
             embedding, arcface_detected = extract_embedding_from_image(image_data)
@@ -3270,6 +3775,31 @@ def get_face_embedding():
         }), 500
 
 
+def _image_to_embedding(image_data, quadrant=None, grid=2):
+    """
+    One /compare-identity input: decode, crop to the grid cell, crop to the
+    detected face, embed. Returns (embedding, face_detected); (None, False)
+    if the image can't be decoded or embedded.
+    """
+    image = _decode_image(image_data)
+    if image is None:
+        return None, False
+
+    if quadrant:
+        image = _grid_cell(image, grid, quadrant)
+
+    face_box = detect_face_mediapipe(image)
+    face_detected = False
+    if face_box:
+        face_detected = True
+        image = _crop_face_padded(image, face_box)
+
+    # BGR straight through; no RGB/PIL round-trip. MediaPipe already ran on
+    # this image, so the embedder doesn't repeat it on a miss.
+    emb, _ = extract_embedding_from_image(image, assume_face_crop=face_detected, detection_tried=True)
+    return emb, face_detected
+
+
 @app.route('/compare-identity', methods=['POST'])
 def compare_identity():
     """
@@ -3286,7 +3816,8 @@ def compare_identity():
         "image1": "data:image/jpeg;base64,...",
         "image2": "data:image/jpeg;base64,...",
         "quadrant1": null,       # Optional: crop image1 to quadrant
-        "quadrant2": "top-left"  # Optional: crop image2 to quadrant
+        "quadrant2": "top-left", # Optional: crop image2 to quadrant
+        "grid_size": 2           # Optional: 2, 3 or "3x4", as in /face-embedding
     }
 
     Returns:
@@ -3299,8 +3830,6 @@ def compare_identity():
     }
     """
     try:
-        import torch
-
         data = request.get_json()
         if not data:
             return jsonify({
@@ -3315,98 +3844,13 @@ def compare_identity():
 
         # Option 2: Extract from images
         elif 'image1' in data and 'image2' in data:
-            # Get embeddings using the /face-embedding logic
-            emb1 = None
-            emb2 = None
-
-            # Process image1
-            img1_data = data['image1']
-            q1 = data.get('quadrant1')
-
-            if ',' in img1_data:
-                img1_clean = img1_data.split(',')[1]
-            else:
-                img1_clean = img1_data
-
-            image_bytes = base64.b64decode(img1_clean)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image1 = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            if q1:
-                h, w = image1.shape[:2]
-                mid_h, mid_w = h // 2, w // 2
-                qmap = {
-                    'top-left': (0, mid_h, 0, mid_w),
-                    'top-right': (0, mid_h, mid_w, w),
-                    'bottom-left': (mid_h, h, 0, mid_w),
-                    'bottom-right': (mid_h, h, mid_w, w)
-                }
-                if q1 in qmap:
-                    y1, y2, x1, x2 = qmap[q1]
-                    image1 = image1[y1:y2, x1:x2]
-
-            # Detect face in image1
-            face_box1 = detect_face_mediapipe(image1)
-            face1_detected = False
-            if face_box1:
-                face1_detected = True
-                h, w = image1.shape[:2]
-                padding = 0.15
-                x, y = face_box1['x'] / 100, face_box1['y'] / 100
-                fw, fh = face_box1['width'] / 100, face_box1['height'] / 100
-                y1 = int(max(0, y - fh * padding) * h)
-                x1 = int(max(0, x - fw * padding) * w)
-                y2 = int(min(1, y + fh * (1 + padding)) * h)
-                x2 = int(min(1, x + fw * (1 + padding)) * w)
-                image1 = image1[y1:y2, x1:x2]
-
-            img1_rgb = cv2.cvtColor(image1, cv2.COLOR_BGR2RGB)
-            img1_pil = Image.fromarray(img1_rgb)
-            emb1, _ = extract_embedding_from_image(img1_pil, assume_face_crop=face1_detected)
-
-            # Process image2 similarly
-            img2_data = data['image2']
-            q2 = data.get('quadrant2')
-
-            if ',' in img2_data:
-                img2_clean = img2_data.split(',')[1]
-            else:
-                img2_clean = img2_data
-
-            image_bytes = base64.b64decode(img2_clean)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image2 = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            if q2:
-                h, w = image2.shape[:2]
-                mid_h, mid_w = h // 2, w // 2
-                qmap = {
-                    'top-left': (0, mid_h, 0, mid_w),
-                    'top-right': (0, mid_h, mid_w, w),
-                    'bottom-left': (mid_h, h, 0, mid_w),
-                    'bottom-right': (mid_h, h, mid_w, w)
-                }
-                if q2 in qmap:
-                    y1, y2, x1, x2 = qmap[q2]
-                    image2 = image2[y1:y2, x1:x2]
-
-            face_box2 = detect_face_mediapipe(image2)
-            face2_detected = False
-            if face_box2:
-                face2_detected = True
-                h, w = image2.shape[:2]
-                padding = 0.15
-                x, y = face_box2['x'] / 100, face_box2['y'] / 100
-                fw, fh = face_box2['width'] / 100, face_box2['height'] / 100
-                y1 = int(max(0, y - fh * padding) * h)
-                x1 = int(max(0, x - fw * padding) * w)
-                y2 = int(min(1, y + fh * (1 + padding)) * h)
-                x2 = int(min(1, x + fw * (1 + padding)) * w)
-                image2 = image2[y1:y2, x1:x2]
-
-            img2_rgb = cv2.cvtColor(image2, cv2.COLOR_BGR2RGB)
-            img2_pil = Image.fromarray(img2_rgb)
-            emb2, _ = extract_embedding_from_image(img2_pil, assume_face_crop=face2_detected)
+            # The two inputs are independent: image2 goes through the worker
+            # pool while this thread handles image1, so their decodes and
+            # ArcFace passes (TensorFlow releases the GIL) overlap.
+            grid = _grid_key(data.get('grid_size', 2))
+            emb2_future = _worker_pool.submit(_image_to_embedding, data['image2'], data.get('quadrant2'), grid)
+            emb1, _ = _image_to_embedding(data['image1'], data.get('quadrant1'), grid)
+            emb2, _ = emb2_future.result()
 
             if emb1 is None or emb2 is None:
                 return jsonify({
@@ -3419,12 +3863,8 @@ def compare_identity():
                 "error": "Must provide either (embedding1, embedding2) or (image1, image2)"
             }), 400
 
-        # Normalize embeddings (should already be normalized, but ensure)
-        emb1 = emb1 / np.linalg.norm(emb1)
-        emb2 = emb2 / np.linalg.norm(emb2)
-
-        # Compute cosine similarity
-        similarity = float(np.dot(emb1, emb2))
+        # Compute cosine similarity (normalizes both; client embeddings may not be)
+        similarity = _cosine_similarity(emb1, emb2)
 
         # Determine if same person and confidence
         # Thresholds tuned for ArcFace 512-D embeddings
@@ -3500,11 +3940,7 @@ def detect_all_faces():
             return jsonify({"success": False, "error": "No image provided"}), 400
 
         # Decode main image
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = _decode_image(image_data)
 
         if image is None:
             return jsonify({"success": False, "error": "Failed to decode image"}), 400
@@ -3512,28 +3948,34 @@ def detect_all_faces():
         height, width = image.shape[:2]
         print(f"[DETECT-ALL] Image size: {width}x{height}")
 
-        # Get reference embedding if provided
-        ref_embedding = None
-        if reference_data:
-            if ',' in reference_data:
-                reference_data = reference_data.split(',')[1]
-            ref_bytes = base64.b64decode(reference_data)
-            ref_arr = np.frombuffer(ref_bytes, np.uint8)
-            ref_image = cv2.imdecode(ref_arr, cv2.IMREAD_COLOR)
-            if ref_image is not None:
-                ref_rgb = cv2.cvtColor(ref_image, cv2.COLOR_BGR2RGB)
-                ref_pil = Image.fromarray(ref_rgb)
-                ref_embedding, _ = extract_embedding_from_image(ref_pil, assume_face_crop=False)
-                if ref_embedding is not None:
-                    ref_embedding = ref_embedding / np.linalg.norm(ref_embedding)
-                    print(f"[DETECT-ALL] Reference embedding extracted")
+        # Get reference embedding if provided. It depends only on the reference
+        # image, so it runs on the worker pool while the detector waterfall
+        # below works on the main image; it is collected once faces are found.
+        def _reference_embedding():
+            ref_image = _decode_image(reference_data)
+            if ref_image is None:
+                return None
+            # Hand the decoded BGR array straight over; a PIL detour converted
+            # BGR->RGB->PIL->RGB->BGR only to arrive back where it started.
+            embedding, _ = extract_embedding_from_image(ref_image, assume_face_crop=False)
+            if embedding is None:
+                return None
+            print(f"[DETECT-ALL] Reference embedding extracted")
+            return embedding
+
+        ref_future = _worker_pool.submit(_reference_embedding) if reference_data else None
 
         # Use DeepFace to detect all faces
         from deepface import DeepFace
 
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-        # Try multiple detectors - retinaface works on photos, opencv/mtcnn better on illustrations
+        # Try multiple detectors - retinaface works on photos, opencv/mtcnn better on illustrations.
+        # With enforce_detection=False a miss is not an empty list: DeepFace
+        # returns the whole image as one face with confidence 0. Only a
+        # detection that clears the 0.5 cut below ends the waterfall;
+        # otherwise every image stopped at 'opencv' and the later detectors
+        # never ran. (DeepFace caches each detector model after first use.)
         face_objs = []
         detectors = ['opencv', 'mtcnn', 'retinaface']
 
@@ -3546,7 +3988,7 @@ def detect_all_faces():
                     enforce_detection=False,
                     align=True
                 )
-                if face_objs:
+                if any(f.get('confidence', 0) >= 0.5 for f in face_objs):
                     print(f"[DETECT-ALL] {detector} found {len(face_objs)} faces")
                     break
             except Exception as e:
@@ -3555,7 +3997,15 @@ def detect_all_faces():
 
         print(f"[DETECT-ALL] Found {len(face_objs)} faces")
 
+        ref_embedding = None
+        if ref_future is not None:
+            try:
+                ref_embedding = ref_future.result()
+            except Exception as e:
+                print(f"[DETECT-ALL] Reference embedding failed: {e}")
+
         faces = []
+        face_embs = []  # (face_info, embedding) for the similarity pass below
         for i, face_obj in enumerate(face_objs):
             facial_area = face_obj.get('facial_area', {})
             face_img = face_obj.get('face')
@@ -3576,25 +4026,33 @@ def detect_all_faces():
                 "confidence": round(confidence, 3)
             }
 
-            # If reference provided, compute similarity
+            # If reference provided, embed the aligned crop
             if ref_embedding is not None and face_img is not None:
                 try:
-                    # face_img is already a numpy array (RGB, float 0-1)
-                    face_uint8 = (face_img * 255).astype(np.uint8)
-                    face_pil = Image.fromarray(face_uint8)
-                    face_emb, _ = extract_embedding_from_image(face_pil, assume_face_crop=True)
-
+                    # face_img is a numpy array (RGB, float 0-1). Convert to
+                    # the BGR uint8 get_arcface_embedding takes directly; the
+                    # old PIL round-trip ended at the same array.
+                    face_bgr = cv2.cvtColor((face_img * 255).astype(np.uint8), cv2.COLOR_RGB2BGR)
+                    face_emb, _ = get_arcface_embedding(face_bgr, assume_face_crop=True)
                     if face_emb is not None:
-                        face_emb = face_emb / np.linalg.norm(face_emb)
-                        similarity = float(np.dot(ref_embedding, face_emb))
-                        face_info["similarity"] = round(similarity, 4)
-                        face_info["same_person"] = similarity > 0.45
-                        face_info["match_confidence"] = "high" if similarity > 0.6 else "medium" if similarity > 0.45 else "low"
+                        face_embs.append((face_info, face_emb))
                 except Exception as e:
-                    print(f"[DETECT-ALL] Error computing similarity for face {i}: {e}")
+                    print(f"[DETECT-ALL] Error embedding face {i}: {e}")
 
             faces.append(face_info)
 
+        # Score every face against the reference in one matrix-vector product
+        # instead of a normalize + dot per face (a 3x4 grid has 12 of them).
+        if face_embs:
+            emb_matrix = np.stack([emb for _, emb in face_embs]).astype(np.float64)
+            emb_matrix /= np.linalg.norm(emb_matrix, axis=1, keepdims=True)
+            ref_unit = np.asarray(ref_embedding, dtype=np.float64)
+            similarities = emb_matrix @ (ref_unit / np.linalg.norm(ref_unit))
+            for (face_info, _), similarity in zip(face_embs, similarities.tolist()):
+                face_info["similarity"] = round(similarity, 4)
+                face_info["same_person"] = similarity > 0.45
+                face_info["match_confidence"] = "high" if similarity > 0.6 else "medium" if similarity > 0.45 else "low"
+
         # Sort by similarity if available (highest first)
         if faces and 'similarity' in faces[0]:
             faces.sort(key=lambda f: f.get('similarity', 0), reverse=True)
@@ -3653,11 +4111,7 @@ def detect_anime_faces():
             return jsonify({"success": False, "error": "No image provided"}), 400
 
         # Decode image
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = _decode_image(image_data)
 
         if image is None:
             return jsonify({"success": False, "error": "Failed to decode image"}), 400
@@ -3720,11 +4174,7 @@ def detect_illustration_faces():
         if not image_data:
             return jsonify({"success": False, "error": "No image provided"}), 400
 
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = _decode_image(image_data)
 
         if image is None:
             return jsonify({"success": False, "error": "Failed to decode image"}), 400
@@ -3799,7 +4249,7 @@ def detect_illustration_faces():
             # Crop the padded face region
             crop = image[py:py+ph, px:px+pw]
             _, crop_jpg = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            crop_b64 = base64.b64encode(crop_jpg.tobytes()).decode('utf-8')
+            crop_b64 = _b64encode(crop_jpg.tobytes())
 
             faces.append({
                 "source": r["source"],
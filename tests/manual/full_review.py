@@ -1,65 +1,102 @@
-from playwright.sync_api import sync_playwright
-import time
+from playwright.async_api import async_playwright
+import asyncio
 import os
 
 os.makedirs('temp_photos/review', exist_ok=True)
 
-def capture_all_sections(page, prefix, is_mobile=False):
+async def wait_until_ready(page):
+    """Wait for the network to go quiet instead of a fixed sleep"""
+    try:
+        await page.wait_for_load_state('networkidle', timeout=5000)
+    except Exception:
+        pass  # long-polling pages never go idle; screenshot what we have
+
+# The landing page scrolls inside a snap container, not the window
+SCROLLER_JS = "document.querySelector('div.overflow-y-auto') || document.scrollingElement"
+
+async def capture_all_sections(page, prefix, is_mobile=False):
     """Scroll through all sections using container scroll"""
-    page.goto('https://magicalstory.ch')
-    time.sleep(3)
-    
-    # Get the scrollable container (first div with overflow-y-auto)
-    container = page.locator('div.overflow-y-auto').first
-    
-    # Get section count by looking for snap-start sections
-    sections = page.locator('section.snap-start').all()
-    print(f"    Found {len(sections)} sections", flush=True)
-    
-    # Capture each section
-    for i, section in enumerate(sections):
+    await page.goto('https://magicalstory.ch')
+    await wait_until_ready(page)
+
+    # Section offsets inside the scroll container, read in one round trip
+    offsets = await page.evaluate(f"""() => {{
+        const c = {SCROLLER_JS};
+        const top = c.getBoundingClientRect().top - c.scrollTop;
+        return Array.from(document.querySelectorAll('section.snap-start'))
+            .map(s => Math.round(s.getBoundingClientRect().top - top));
+    }}""")
+    print(f"    [{prefix}] Found {len(offsets)} sections", flush=True)
+
+    # Capture each section: scroll, wait until the container actually arrived
+    # (clamped to its max scroll), then a short settle for entry animations
+    for i, y in enumerate(offsets):
         try:
-            section.scroll_into_view_if_needed()
-            time.sleep(0.8)
-            page.screenshot(path=f'temp_photos/review/{prefix}_sec{i+1}.png')
-        except:
+            await page.evaluate(f"y => ({SCROLLER_JS}).scrollTo(0, y)", y)
+            await page.wait_for_function(f"""y => {{
+                const c = {SCROLLER_JS};
+                return Math.abs(c.scrollTop - Math.min(y, c.scrollHeight - c.clientHeight)) <= 2;
+            }}""", arg=y, timeout=3000)
+            await page.wait_for_timeout(100)
+            await page.screenshot(path=f'temp_photos/review/{prefix}_sec{i+1}.png')
+        except Exception:
             pass
-    
-    return len(sections)
 
-def main():
+    return len(offsets)
+
+async def review_config(browser, browser_name, device, width, height, is_mobile):
+    """One isolated context per config; the browser itself is shared"""
+    print(f"Testing {browser_name} {device}...", flush=True)
+    context = await browser.new_context(viewport={'width': width, 'height': height})
+    try:
+        page = await context.new_page()
+        prefix = f'{browser_name}_{device}'
+        await capture_all_sections(page, prefix, is_mobile)
+
+        # Pricing
+        await page.goto('https://magicalstory.ch/pricing')
+        await wait_until_ready(page)
+        await page.screenshot(path=f'temp_photos/review/{prefix}_pricing.png', full_page=True)
+    finally:
+        await context.close()
+
+async def main():
     print("=== COMPREHENSIVE WEBSITE REVIEW ===\n", flush=True)
-    
-    with sync_playwright() as p:
+
+    async with async_playwright() as p:
         configs = [
             ('chromium', 'desktop', 1440, 900, False),
             ('chromium', 'mobile', 375, 812, True),
             ('firefox', 'desktop', 1440, 900, False),
             ('webkit', 'mobile', 375, 812, True),
         ]
-        
-        for browser_name, device, width, height, is_mobile in configs:
-            print(f"Testing {browser_name} {device}...", flush=True)
-            
-            if browser_name == 'chromium':
-                browser = p.chromium.launch(headless=True)
-            elif browser_name == 'firefox':
-                browser = p.firefox.launch(headless=True)
-            else:
-                browser = p.webkit.launch(headless=True)
-            
-            page = browser.new_page(viewport={'width': width, 'height': height})
-            prefix = f'{browser_name}_{device}'
-            capture_all_sections(page, prefix, is_mobile)
-            
-            # Pricing
-            page.goto('https://magicalstory.ch/pricing')
-            time.sleep(2)
-            page.screenshot(path=f'temp_photos/review/{prefix}_pricing.png', full_page=True)
-            
-            browser.close()
-    
+
+        # Launch each engine once and run every config concurrently in its own
+        # context, instead of relaunching a browser per config and sleeping serially
+        engines = sorted({c[0] for c in configs})
+        launched = await asyncio.gather(*(getattr(p, name).launch(headless=True) for name in engines))
+        browsers = dict(zip(engines, launched))
+        try:
+            # return_exceptions: one failing config must not close the shared
+            # browsers while the others are still running (their errors would
+            # then read as "browser closed" and hide the real one)
+            results = await asyncio.gather(
+                *(review_config(browsers[c[0]], *c) for c in configs), return_exceptions=True)
+        finally:
+            await asyncio.gather(*(b.close() for b in browsers.values()))
+
+    print("", flush=True)
+    failed = 0
+    for (browser_name, device, *_), result in zip(configs, results):
+        if isinstance(result, BaseException):
+            failed += 1
+            print(f"  {browser_name} {device}: FAILED - {type(result).__name__}: {result}", flush=True)
+        else:
+            print(f"  {browser_name} {device}: OK", flush=True)
+
     print("\nDone! Analyzing screenshots...", flush=True)
+    if failed:
+        raise SystemExit(f"{failed} of {len(configs)} configs failed")
 
 if __name__ == '__main__':
-    main()
+    asyncio.run(main())
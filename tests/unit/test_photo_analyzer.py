@@ -0,0 +1,271 @@
+"""
+Unit tests for photo_analyzer.py helpers.
+
+Run from the repo root: python -m pytest tests/unit
+Imports the service module directly; the optional models (MediaPipe, rembg,
+DeepFace, ...) are lazy or guarded there, so nothing heavy loads here.
+"""
+
+import base64
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import photo_analyzer as pa  # noqa: E402
+
+
+def _face_thumb_crop(image, face_box):
+    return pa.crop_to_box(image, pa.add_asymmetric_padding_to_box(face_box, **pa._THUMB_PADDING))
+
+
+# ── Face thumbnail crop (create_face_thumbnail / /analyze 768px thumb) ──────
+
+def test_face_thumb_crop_keeps_size_when_top_padding_is_clipped():
+    image = np.zeros((1000, 800, 3), dtype=np.uint8)
+    crop = _face_thumb_crop(image, {'x': 30, 'y': 10, 'width': 30, 'height': 30})
+    assert crop.shape[:2] == (495, 360)
+
+
+def test_face_thumb_crop_keeps_size_when_left_padding_is_clipped():
+    image = np.zeros((1000, 800, 3), dtype=np.uint8)
+    crop = _face_thumb_crop(image, {'x': 2, 'y': 40, 'width': 30, 'height': 30})
+    assert crop.shape[:2] == (495, 360)
+
+
+def test_face_thumb_crop_unclipped():
+    image = np.zeros((1000, 800, 3), dtype=np.uint8)
+    crop = _face_thumb_crop(image, {'x': 30, 'y': 30, 'width': 30, 'height': 30})
+    assert crop.shape[:2] == (495, 360)
+
+
+def test_crop_face_padded_stays_inside_image():
+    image = np.zeros((1000, 800, 3), dtype=np.uint8)
+    crop = pa._crop_face_padded(image, {'x': 0, 'y': 0, 'width': 100, 'height': 100})
+    assert crop.shape[:2] == (1000, 800)
+
+
+# ── OpenCV face fallback (YuNet, then Haar) ─────────────────────────────────
+
+def test_clip_box_px_shrinks_size_with_clamped_origin():
+    assert pa._clip_box_px(-10.0, -20.0, 50.0, 60.0, 200, 100) == (0.0, 0.0, 40.0, 40.0)
+    assert pa._clip_box_px(180.0, 90.0, 50.0, 60.0, 200, 100) == (180.0, 90.0, 20.0, 10.0)
+
+
+def test_yunet_init_failure_is_cached(monkeypatch, tmp_path, capsys):
+    bad_model = tmp_path / 'yunet.onnx'
+    bad_model.write_bytes(b'not an onnx model')
+    monkeypatch.setattr(pa, 'YUNET_MODEL', str(bad_model))
+    monkeypatch.setattr(pa, '_yunet', None)
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+
+    assert pa._detect_faces_yunet(image) is None
+    assert pa._yunet is pa._YUNET_FAILED
+    assert 'YuNet init failed' in capsys.readouterr().out
+
+    assert pa._detect_faces_yunet(image) is None
+    assert capsys.readouterr().out == ''
+
+
+class _OneFaceCascade:
+    def detectMultiScale(self, gray, **kwargs):
+        return np.array([[10, 20, 30, 30]])
+
+
+def test_opencv_fallback_tries_haar_when_yunet_finds_nothing(monkeypatch):
+    monkeypatch.setattr(pa, '_detect_faces_yunet', lambda image: [])
+    monkeypatch.setattr(pa, '_FRONTAL_FACE_CASCADE', _OneFaceCascade())
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    face = pa.detect_face_opencv(image)
+    assert face is not None and face['x'] == 10 and face['y'] == 20
+    assert len(pa.detect_all_faces_opencv(image)) == 1
+
+
+# ── Image decode ────────────────────────────────────────────────────────────
+
+def test_decode_image_round_trips_data_url_and_raw_base64():
+    image = np.full((4, 6, 3), 7, dtype=np.uint8)
+    ok, buffer = cv2.imencode('.png', image)
+    assert ok
+    raw = base64.b64encode(buffer).decode('ascii')
+    for image_data in (raw, 'data:image/png;base64,' + raw):
+        decoded = pa._decode_image(image_data)
+        assert decoded is not None and np.array_equal(decoded, image)
+
+
+def test_decode_image_returns_none_for_non_image_bytes():
+    assert pa._decode_image('data:image/png;base64,AAAA') is None
+
+
+# ── /analyze result cache and admission ─────────────────────────────────────
+
+def test_analyze_cache_key_covers_image_face_and_cached_faces():
+    faces = [{'id': 0, 'x': 1.0, 'y': 2.0}]
+    key = pa._analyze_cache_key('img', None, None)
+    assert key == pa._analyze_cache_key('img', None, None)
+    assert len(key) == 16
+    assert key != pa._analyze_cache_key('img2', None, None)
+    assert key != pa._analyze_cache_key('img', 0, None)
+    assert pa._analyze_cache_key('img', 0, faces) != pa._analyze_cache_key('img', 0, None)
+    # Dict key order in cached_faces doesn't change the key
+    assert (pa._analyze_cache_key('img', 0, faces)
+            == pa._analyze_cache_key('img', 0, [{'y': 2.0, 'x': 1.0, 'id': 0}]))
+
+
+@pytest.fixture
+def analyze_client(monkeypatch):
+    """/analyze with a 2-entry cache, 1 slot and process_photo recording its calls."""
+    calls = []
+
+    def fake_process_photo(image_data, selected_face_id=None, cached_faces=None):
+        calls.append(image_data)
+        # The request's slot is held while the photo is processed
+        assert not pa._analyze_slots.acquire(blocking=False)
+        return {'success': image_data != 'bad', 'image': image_data}
+
+    monkeypatch.setattr(pa, 'process_photo', fake_process_photo)
+    monkeypatch.setattr(pa, 'ANALYZE_CACHE_SIZE', 2)
+    monkeypatch.setattr(pa, '_analyze_cache', OrderedDict())
+    monkeypatch.setattr(pa, '_analyze_slots', threading.BoundedSemaphore(1))
+    client = pa.app.test_client()
+
+    def post(image_data):
+        return client.post('/analyze', json={'image': image_data})
+
+    return post, calls
+
+
+def test_analyze_cache_returns_repeat_and_evicts_least_recent(analyze_client):
+    post, calls = analyze_client
+    for image_data in ('a', 'b', 'a', 'c'):
+        assert post(image_data).get_json()['image'] == image_data
+    # 'a' was served from the cache and refreshed, so 'c' evicted 'b'
+    assert calls == ['a', 'b', 'c']
+    post('a')
+    post('b')
+    assert calls == ['a', 'b', 'c', 'b']
+
+
+def test_analyze_cache_skips_failed_results(analyze_client):
+    post, calls = analyze_client
+    assert post('bad').status_code == 500
+    assert post('bad').status_code == 500
+    assert calls == ['bad', 'bad']
+
+
+def test_analyze_cache_hit_does_not_wait_for_a_slot(analyze_client):
+    post, calls = analyze_client
+    post('a')
+    assert pa._analyze_slots.acquire(blocking=False)
+    try:
+        responses = []
+        t = threading.Thread(target=lambda: responses.append(post('a')))
+        t.start()
+        t.join(timeout=5)
+        assert not t.is_alive()
+        assert responses[0].status_code == 200
+    finally:
+        pa._analyze_slots.release()
+    assert calls == ['a']
+
+
+# ── process_photo shares one RGB frame ──────────────────────────────────────
+
+def _blue_png_data_url(h=120, w=160):
+    image = np.zeros((h, w, 3), dtype=np.uint8)
+    image[:, :, 0] = 255  # pure blue in BGR
+    ok, buffer = cv2.imencode('.png', image)
+    assert ok
+    return 'data:image/png;base64,' + base64.b64encode(buffer).decode('ascii')
+
+
+def test_process_photo_hands_rgb_to_detection_and_background_removal(monkeypatch):
+    seen = {}
+
+    def fake_detect(rgb_image, min_confidence=0.15):
+        seen['detect'] = rgb_image
+        return [{'id': 0, 'x': 30.0, 'y': 20.0, 'width': 30.0, 'height': 30.0, 'confidence': 0.9}]
+
+    def fake_remove_background(image, rgb_image=None):
+        seen['bg_bgr'], seen['bg_rgb'] = image, rgb_image
+        return None, None
+
+    monkeypatch.setattr(pa, 'detect_all_faces_mediapipe', fake_detect)
+    monkeypatch.setattr(pa, 'remove_background', fake_remove_background)
+
+    result = pa.process_photo(_blue_png_data_url())
+    assert result['success'], result
+
+    assert seen['detect'][0, 0].tolist() == [0, 0, 255]
+    assert seen['bg_bgr'][0, 0].tolist() == [255, 0, 0]
+    assert seen['bg_rgb'][0, 0].tolist() == [0, 0, 255]
+
+
+def test_process_photo_no_face_skips_background_removal(monkeypatch):
+    monkeypatch.setattr(pa, 'detect_all_faces_mediapipe', lambda rgb_image, **kwargs: [])
+    monkeypatch.setattr(pa, 'remove_background', lambda *args, **kwargs: pytest.fail('rembg ran'))
+
+    result = pa.process_photo(_blue_png_data_url())
+    assert result['error'] == 'no_face_detected'
+
+
+
+def test_process_photo_caps_the_working_frame(monkeypatch):
+    seen = {}
+
+    def fake_remove_background(image, rgb_image=None):
+        seen['bg'] = image.shape[:2]
+        return None, None
+
+    monkeypatch.setattr(pa, 'detect_all_faces_mediapipe', lambda rgb_image, **kwargs: [
+        {'id': 0, 'x': 30.0, 'y': 20.0, 'width': 30.0, 'height': 30.0, 'confidence': 0.9}])
+    monkeypatch.setattr(pa, 'remove_background', fake_remove_background)
+
+    result = pa.process_photo(_blue_png_data_url(h=1000, w=3000))
+    assert result['success'], result
+    assert seen['bg'] == (682, pa.MAX_IMAGE_DIM)
+    assert result['image_dimensions'] == {'width': 3000, 'height': 1000}
+
+# ── ArcFace embedding input ─────────────────────────────────────────────────
+
+def test_image_to_embedding_does_not_repeat_a_missed_detection(monkeypatch):
+    detections, embed_calls = [], []
+    monkeypatch.setattr(pa, 'detect_face_mediapipe', lambda image: detections.append(image) or None)
+    monkeypatch.setattr(pa, 'get_arcface_embedding',
+                        lambda image, **kwargs: embed_calls.append(kwargs) or (None, False))
+
+    pa._image_to_embedding(_blue_png_data_url())
+    assert len(detections) == 1
+    assert embed_calls == [{'assume_face_crop': False, 'detection_tried': True}]
+
+
+# ── /warmup MediaPipe graphs ────────────────────────────────────────────────
+
+class _NoDetections:
+    detections = []
+
+
+@pytest.mark.parametrize('legacy', [True, False])
+def test_warmup_builds_the_graph_keys_detection_uses(monkeypatch, legacy):
+    keys = []
+    monkeypatch.setattr(pa, '_mp_process',
+                        lambda kind, rgb, **params: keys.append((kind,) + tuple(sorted(params.items())))
+                        or _NoDetections())
+    monkeypatch.setattr(pa, 'MEDIAPIPE_AVAILABLE', legacy)
+    monkeypatch.setattr(pa, 'MEDIAPIPE_TASKS_AVAILABLE', not legacy)
+    monkeypatch.setattr(pa, 'MTCNN_AVAILABLE', False)
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+
+    pa._warm_mp_graphs()
+    warmed, keys[:] = set(keys), []
+    pa.detect_all_faces_mediapipe(image, min_confidence=0.15)  # as process_photo calls it
+    if legacy:
+        pa.detect_face_mediapipe(image)
+    assert keys and set(keys) <= warmed